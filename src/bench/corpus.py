@@ -0,0 +1,90 @@
+import os
+import random
+import shutil
+from typing import Dict, List
+
+
+class SyntheticCorpus:
+    """
+    Generates a reproducible source tree of Markdown (with Jekyll front
+    matter), HTML (with a <title>) and JS files, with marker keywords planted
+    in a known share of the files so that searches of every selectivity can
+    be timed.
+    """
+
+    # Keyword -> share of the files that contain it once
+    keywords = {
+        "needlerare": 0.01,
+        "needlemid": 0.1,
+        "needlecommon": 1.0,
+        "needlenone": 0.0,
+    }
+
+    extensions = ["md", "html", "js"]
+
+    words = (
+        "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+        " tempor incididunt ut labore et dolore magna aliqua search index"
+        " document source keyword chunk thread batch cache query result"
+    ).split()
+
+    @classmethod
+    def make_line(cls, rnd: random.Random, n_words: int) -> str:
+        return " ".join(rnd.choice(cls.words) for _ in range(n_words))
+
+    @classmethod
+    def make_file(
+        cls, rnd: random.Random, extension: str, title: str, body: List[str]
+    ) -> str:
+        if extension == "md":
+            return "\n".join(["---", f"title: {title}", "layout: post", "---"] + body)
+        elif extension == "html":
+            return "\n".join(
+                [f"<html><head><title>{title}</title></head><body>"]
+                + [f"<p>{line}</p>" for line in body]
+                + ["</body></html>"]
+            )
+
+        return "\n".join(
+            [f"// {title}", "function main() {"]
+            + [f'    console.log("{line}");' for line in body]
+            + ["}"]
+        )
+
+    @classmethod
+    def generate(
+        cls,
+        root: str,
+        n_files: int,
+        n_lines: int = 50,
+        n_words: int = 10,
+        n_dirs: int = 10,
+        seed: int = 0,
+    ) -> Dict[str, int]:
+        """
+        Replaces root with n_files files of n_lines lines each, spread over
+        n_dirs folders. Returns {keyword: number of files that contain it}.
+        """
+        rnd = random.Random(seed)
+        counts = {keyword: 0 for keyword in cls.keywords}
+
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+
+        for i in range(n_files):
+            extension = cls.extensions[i % len(cls.extensions)]
+            body = [cls.make_line(rnd, n_words) for _ in range(n_lines)]
+
+            for keyword, share in cls.keywords.items():
+                if rnd.random() < share:
+                    line_no = rnd.randrange(n_lines)
+                    body[line_no] = f"{body[line_no]} {keyword}"
+                    counts[keyword] += 1
+
+            directory = os.path.join(root, f"dir{i % n_dirs}")
+            os.makedirs(directory, exist_ok=True)
+
+            with open(os.path.join(directory, f"file{i}.{extension}"), "w") as file:
+                file.write(cls.make_file(rnd, extension, f"Page {i}", body))
+
+        return counts
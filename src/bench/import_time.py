@@ -0,0 +1,76 @@
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Only ever needed by utilities the server does not call
+FORBIDDEN_MODULES = ["pandas", "multiexit"]
+
+
+def measure(module: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) of everything a fresh interpreter
+    imports to import module, from -X importtime
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+
+    if proc.returncode != 0:
+        raise Exception(f"cannot import {module}:\n{proc.stderr}")
+
+    ret = []
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        ret.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return ret
+
+
+def check(module: str, budget_ms: float, n_runs: int, n_top: int) -> bool:
+    # Best of n_runs, the first one also pays for cold .pyc and disk caches
+    runs = [measure(module) for _ in range(n_runs)]
+    cumulative: Dict[str, int] = {name: total for name, _, total in runs[0]}
+    best_ms = (
+        min(next(total for name, _, total in run if name == module) for run in runs)
+        / 1000.0
+    )
+
+    print(f"import {module}: {best_ms:.1f} ms (budget {budget_ms:.1f} ms)")
+
+    print(f"heaviest of {len(cumulative)} modules:")
+    heaviest = sorted(
+        [(total, name) for name, _, total in runs[0] if name != module],
+        reverse=True,
+    )
+
+    for total, name in heaviest[:n_top]:
+        print(f"  {total / 1000.0:8.1f} ms  {name}")
+
+    is_good = best_ms <= budget_ms
+
+    for name in FORBIDDEN_MODULES:
+        if name in cumulative:
+            print(f"{name} is imported, it should be loaded on first use")
+            is_good = False
+
+    return is_good
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fails when importing the server takes longer than a budget"
+    )
+    parser.add_argument("--module", default="src.restful")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.exit(0 if check(args.module, args.budget_ms, args.runs, args.top) else 1)
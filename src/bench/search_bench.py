@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from src.bench.corpus import SyntheticCorpus
+from src.core.document_store import DocumentStore
+from src.core.mapped_file import MappedFile
+from src.core.search_sys import SearchSys
+from src.core.source_index import SourceIndex
+from src.utils.util import LogLevel, Util
+
+# Keywords by selectivity, plus one too short for the trigram index
+KEYWORDS = list(SyntheticCorpus.keywords.keys()) + ["ne"]
+
+
+async def reset_caches():
+    """
+    Forgets everything a previous search left in memory
+    """
+    SearchSys.sources = {}
+    await SearchSys.get_file_paths.__func__.cache.clear()
+    DocumentStore.cache = None
+    MappedFile.newline_tables.clear()
+
+
+async def time_runs(run: Callable, n_runs: int, is_cold: bool) -> Dict:
+    timings = []
+
+    for _ in range(n_runs):
+        if is_cold:
+            await reset_caches()
+
+        start = time.perf_counter()
+        await run()
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "runs_ms": timings,
+    }
+
+
+async def bench_corpus(root: str, n_threads: int, n_runs: int) -> List[Dict]:
+    ret = []
+    extensions = SyntheticCorpus.extensions
+    abs_paths = list((await SearchSys.get_file_paths(root)).values())
+    contents = await SearchSys.read_all(abs_paths)
+
+    async def get_file_paths():
+        await SearchSys.get_file_paths(root)
+
+    async def read_all():
+        await SearchSys.read_all(abs_paths)
+
+    cases = [("get_file_paths", None, get_file_paths), ("read_all", None, read_all)]
+
+    for keyword in KEYWORDS:
+
+        async def find_in_file(keyword=keyword):
+            for path, lines in contents.items():
+                SearchSys.find_in_file(keyword, lines, 4, path)
+
+        async def find_in_files(keyword=keyword):
+            await SearchSys.find_in_files(
+                root, keyword, n_threads=n_threads, file_extensions=extensions
+            )
+
+        cases += [
+            ("find_in_file", keyword, find_in_file),
+            ("find_in_files", keyword, find_in_files),
+        ]
+
+    for name, keyword, run in cases:
+        for is_cold in [True, False]:
+            if not is_cold:
+                # Warm runs start from one untimed run
+                await run()
+
+            ret.append(
+                {
+                    "name": name,
+                    "keyword": keyword,
+                    "n_threads": n_threads,
+                    "cache": "cold" if is_cold else "warm",
+                    **(await time_runs(run, n_runs, is_cold)),
+                }
+            )
+
+    return ret
+
+
+async def run_suite(sizes: List[int], threads: List[int], n_runs: int) -> Dict:
+    results = []
+
+    # Scans must not be throttled between runs
+    SourceIndex.scan_interval = 0.0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_files in sizes:
+            root = os.path.join(tmp_dir, f"corpus{n_files}")
+            counts = SyntheticCorpus.generate(root, n_files)
+
+            for n_threads in threads:
+                for result in await bench_corpus(root, n_threads, n_runs):
+                    result["n_files"] = n_files
+                    result["n_matching_files"] = counts.get(result["keyword"])
+                    results.append(result)
+
+                    print(
+                        f"{n_files:>7} files {n_threads:>4} threads"
+                        f" {result['name']:>15} {result['cache']:>4}"
+                        f" {str(result['keyword']):>13}: {result['median_ms']:10.2f} ms"
+                    )
+
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "n_runs": n_runs,
+        "results": results,
+    }
+
+
+def get_case_key(result: Dict) -> str:
+    return "/".join(
+        str(result[k]) for k in ["name", "keyword", "n_files", "n_threads", "cache"]
+    )
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float, min_ms: float) -> bool:
+    """
+    Prints cases whose median got slower than the baseline's by more than
+    tolerance (a ratio), returns False if there is any. Cases faster than
+    min_ms in both are noise and are not compared.
+    """
+    old = {get_case_key(result): result for result in baseline["results"]}
+    n_regressions = 0
+
+    for result in current["results"]:
+        key = get_case_key(result)
+
+        if key not in old:
+            continue
+
+        before, after = old[key]["median_ms"], result["median_ms"]
+
+        if max(before, after) < min_ms:
+            continue
+
+        ratio = after / before if before > 0 else float("inf")
+        flag = ""
+
+        if ratio > 1.0 + tolerance:
+            flag = "  REGRESSION"
+            n_regressions += 1
+
+        print(f"{key:>60}: {before:10.2f} -> {after:10.2f} ms ({ratio:5.2f}x){flag}")
+
+    print(f"{n_regressions} regressions")
+
+    return n_regressions == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Times the SearchSys pipeline on synthetic corpora"
+    )
+    parser.add_argument("--sizes", default="100,1000")
+    parser.add_argument("--threads", default="16,128")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument(
+        "--compare", default=None, help="baseline JSON to flag regressions against"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    # Every refresh logs at DEBUG level
+    Util.update_log_level(LogLevel.RELEASE)
+
+    report = asyncio.run(
+        run_suite(
+            [int(n) for n in args.sizes.split(",")],
+            [int(n) for n in args.threads.split(",")],
+            args.runs,
+        )
+    )
+
+    with open(args.out, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(f"results written to {args.out}")
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            is_good = compare(json.load(file), report, args.tolerance, args.min_ms)
+
+        sys.exit(0 if is_good else 1)
@@ -0,0 +1,79 @@
+import math
+from typing import List, Optional, Tuple
+
+import numpy
+
+from src.core.term_index import TermIndex
+
+
+class BM25:
+    """
+    Okapi BM25 over a TermIndex. Scores of all candidate chunks are computed as
+    array operations, and only the top k are ever sorted.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    @classmethod
+    def score(
+        cls, terms: TermIndex, query_terms: List[str]
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns (chunk ids, scores) of every chunk that has any query term
+        """
+        n_chunks = terms.n_chunks
+        id_parts, tf_parts, idf_parts = [], [], []
+
+        for term in set(query_terms):
+            posting = terms.get_posting(term)
+
+            if posting is None:
+                continue
+
+            chunk_ids, tfs = posting
+            df = len(chunk_ids)
+            idf = math.log(1.0 + (n_chunks - df + 0.5) / (df + 0.5))
+
+            id_parts.append(chunk_ids.astype(numpy.int64, copy=False))
+            tf_parts.append(tfs.astype(numpy.float32, copy=False))
+            idf_parts.append(numpy.full(df, idf, dtype=numpy.float32))
+
+        if len(id_parts) == 0:
+            return numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.float32)
+
+        ids = numpy.concatenate(id_parts)
+        tfs = numpy.concatenate(tf_parts)
+        idfs = numpy.concatenate(idf_parts)
+
+        lengths = terms.chunk_lengths[ids]
+        avg_length = max(terms.get_avg_length(), 1.0)
+
+        per_term = (
+            idfs
+            * tfs
+            * (cls.k1 + 1.0)
+            / (tfs + cls.k1 * (1.0 - cls.b + cls.b * lengths / avg_length))
+        )
+
+        # Sum the per-term scores of each chunk
+        chunk_ids, inverse = numpy.unique(ids, return_inverse=True)
+        scores = numpy.bincount(inverse, weights=per_term)
+
+        return chunk_ids, scores
+
+    @staticmethod
+    def top_k(
+        chunk_ids: numpy.ndarray, scores: numpy.ndarray, k: Optional[int] = None
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Best k (all if k is None) chunk ids and scores, best first
+        """
+        if k is not None and k < len(scores):
+            picked = numpy.argpartition(-scores, k - 1)[:k]
+        else:
+            picked = numpy.arange(len(scores))
+
+        order = picked[numpy.argsort(-scores[picked], kind="stable")]
+
+        return chunk_ids[order], scores[order]
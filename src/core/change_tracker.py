@@ -0,0 +1,104 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.utils.file_walker import FileWalker
+from src.utils.util import Util
+
+
+class ChangeTracker:
+    """
+    Remembers (mtime, size, inode) of every file under a root so that a rescan
+    only costs a stat per file, and reports which files need to be re-read.
+    """
+
+    root: str = None
+    file_extensions: Optional[List[str]] = None
+
+    # gitignore-style rules of files to leave out, see FileWalker
+    excludes: Optional[List[str]] = None
+
+    # Folders listed at once during a scan
+    n_walkers: int = 8
+
+    # relative path -> (mtime_ns, size, inode), sorted by path
+    stats: Dict[str, Tuple[int, int, int]] = None
+
+    __watch_task: Optional[asyncio.Task] = None
+
+    def __init__(
+        self,
+        root: str,
+        file_extensions: Optional[List[str]] = None,
+        excludes: Optional[List[str]] = None,
+    ):
+        self.root = root
+        self.file_extensions = file_extensions
+        self.excludes = excludes
+        self.stats = {}
+
+    def scan(
+        self,
+    ) -> Tuple[Dict[str, Tuple[int, int, int]], List[str], List[str], List[str]]:
+        """
+        Re-stats the tree and returns (current stats, added, changed, removed)
+        with the relative paths that differ from the recorded stats. Nothing is
+        recorded here: the caller records every path once it applied it, see
+        record() and forget(), so that an update cut short shows up again on
+        the next scan.
+        """
+        walker = FileWalker(
+            self.root, self.file_extensions, self.excludes, self.n_walkers
+        )
+
+        # Folders are listed in parallel, sorting keeps the order stable
+        current: Dict[str, Tuple[int, int, int]] = dict(sorted(walker.walk()))
+
+        added = [path for path in current if path not in self.stats]
+        changed = [
+            path
+            for path, stat in current.items()
+            if path in self.stats and self.stats[path] != stat
+        ]
+        removed = [path for path in self.stats if path not in current]
+
+        return current, added, changed, removed
+
+    def record(self, path: str, stat: Tuple[int, int, int]):
+        self.stats[path] = stat
+
+    def forget(self, path: str):
+        self.stats.pop(path, None)
+
+    def sort(self):
+        # Paths recorded for the first time come last
+        self.stats = dict(sorted(self.stats.items()))
+
+    def get_abs_path(self, relative_path: str) -> str:
+        return self.root + relative_path
+
+    def is_watching(self) -> bool:
+        return self.__watch_task is not None and not self.__watch_task.done()
+
+    def watch(self, on_change: Callable, interval: float = 2.0):
+        """
+        Polling stand-in for inotify: calls the async on_change() every
+        interval seconds, which is expected to rescan and apply changes
+        """
+
+        async def poll():
+            while True:
+                try:
+                    await on_change()
+                except Exception as e:
+                    Util.error(e)
+
+                await asyncio.sleep(interval)
+
+        if not self.is_watching():
+            self.__watch_task = asyncio.create_task(poll())
+
+    def unwatch(self):
+        if self.is_watching():
+            self.__watch_task.cancel()
+
+        self.__watch_task = None
@@ -0,0 +1,221 @@
+import itertools
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy
+
+from src.core.document import Document
+from src.core.document_store import DocumentStore
+from src.utils.sized_lru_cache import SizedLRUCache
+
+
+class CorpusBuffer:
+    """
+    The case-folded chunks of a whole source joined into one string, with
+    offset arrays to map a position back to its document and chunk. A keyword
+    is then found with repeated str.find over a single buffer instead of a
+    Python loop over every chunk.
+    """
+
+    # Between chunks so that no hit spans two of them
+    separator = "\0"
+
+    buffer: str = ""
+
+    # Entry -> offset of its first character in buffer, ascending
+    starts: numpy.ndarray = None
+
+    # Entry -> index in paths and chunk index in that document
+    doc_nos: numpy.ndarray = None
+    chunk_idxs: numpy.ndarray = None
+
+    paths: List[str] = None
+
+    def __init__(self, documents: Iterable[Tuple[str, Document]]):
+        parts: List[str] = []
+        lengths: List[int] = []
+        doc_nos: List[int] = []
+        chunk_idxs: List[int] = []
+        self.paths = []
+
+        for path, document in documents:
+            doc_no = len(self.paths)
+            self.paths.append(path)
+
+            for idx, folded_chunk in enumerate(document.folded_chunks):
+                parts.append(folded_chunk)
+                lengths.append(len(folded_chunk) + len(self.separator))
+                doc_nos.append(doc_no)
+                chunk_idxs.append(idx)
+
+        self.buffer = self.separator.join(parts)
+        del parts
+
+        self.starts = numpy.zeros(len(lengths), dtype=numpy.int64)
+        numpy.cumsum(numpy.array(lengths[:-1], dtype=numpy.int64), out=self.starts[1:])
+        self.doc_nos = numpy.array(doc_nos, dtype=numpy.int32)
+        self.chunk_idxs = numpy.array(chunk_idxs, dtype=numpy.int32)
+
+    def get_size(self) -> int:
+        return (
+            sys.getsizeof(self.buffer)
+            + self.starts.nbytes
+            + self.doc_nos.nbytes
+            + self.chunk_idxs.nbytes
+            + SizedLRUCache.estimate_size(self.paths)
+        )
+
+    def find(self, folded_keyword: str) -> Dict[str, Set[int]]:
+        """
+        {relative path: indexes of the chunks that contain folded_keyword}
+        """
+        ret: Dict[str, Set[int]] = {}
+        n_entries = len(self.starts)
+        pos = self.buffer.find(folded_keyword) if n_entries > 0 else -1
+
+        while pos != -1:
+            entry = int(numpy.searchsorted(self.starts, pos, side="right")) - 1
+            ret.setdefault(self.paths[self.doc_nos[entry]], set()).add(
+                int(self.chunk_idxs[entry])
+            )
+
+            # The rest of this chunk cannot add anything
+            if entry + 1 >= n_entries:
+                break
+
+            pos = self.buffer.find(folded_keyword, int(self.starts[entry + 1]))
+
+        return ret
+
+
+class CorpusBuffers(NamedTuple):
+    """
+    The blocks of one corpus, searched as one
+    """
+
+    buffers: List[CorpusBuffer]
+
+    def find(self, folded_keyword: str) -> Dict[str, Set[int]]:
+        ret: Dict[str, Set[int]] = {}
+
+        for buffer in self.buffers:
+            ret.update(buffer.find(folded_keyword))
+
+        return ret
+
+
+class CorpusBlocks:
+    """
+    A source's corpus as CorpusBuffers of about block_size characters each,
+    so that a changed document only costs rebuilding its block. Built blocks
+    live in the DocumentStore next to the documents they come from and count
+    against its budget, an evicted block is built again when a scan needs it.
+    """
+
+    block_size = 1024 * 1024
+
+    # Unique across all corpora, a block built from documents that changed
+    # meanwhile is stored under a version nobody asks for anymore
+    versions = itertools.count()
+
+    # Block no -> {relative path: size estimate} of its documents
+    blocks: List[Dict[str, int]] = None
+    block_sizes: List[int] = None
+    block_versions: List[int] = None
+
+    # Relative path -> block no
+    block_nos: Dict[str, int] = None
+
+    def __init__(self):
+        self.blocks = []
+        self.block_sizes = []
+        self.block_versions = []
+        self.block_nos = {}
+
+    @staticmethod
+    def get_key(version: int) -> Tuple[str, int]:
+        return "corpus", version
+
+    def invalidate(self, block_no: int):
+        DocumentStore.pop(self.get_key(self.block_versions[block_no]))
+        self.block_versions[block_no] = next(self.versions)
+
+    def update(self, path: str, size: Optional[int] = None):
+        """
+        Records a new version of a document, whose size estimates that of its
+        folded chunks, or its removal when size is None
+        """
+        block_no = self.block_nos.pop(path, None)
+
+        if block_no is not None:
+            self.block_sizes[block_no] -= self.blocks[block_no].pop(path)
+            self.invalidate(block_no)
+
+        if size is None:
+            return
+
+        # A new document goes to the last block, or to a new one when it is full
+        if block_no is None:
+            if len(self.blocks) == 0 or self.block_sizes[-1] >= self.block_size:
+                self.blocks.append({})
+                self.block_sizes.append(0)
+                self.block_versions.append(next(self.versions))
+
+            block_no = len(self.blocks) - 1
+            self.invalidate(block_no)
+
+        self.blocks[block_no][path] = size
+        self.block_sizes[block_no] += size
+        self.block_nos[path] = block_no
+
+    def get(self) -> Tuple[List[CorpusBuffer], List[Tuple[int, int, List[str]]]]:
+        """
+        (blocks at hand, (block no, version, relative paths) of the blocks to
+        build), see build
+        """
+        ret = []
+        missing = []
+
+        for block_no, paths in enumerate(self.blocks):
+            if len(paths) == 0:
+                continue
+
+            version = self.block_versions[block_no]
+            buffer = DocumentStore.get(self.get_key(version))
+
+            if buffer is None:
+                missing.append((block_no, version, list(paths)))
+            else:
+                ret.append(buffer)
+
+        return ret, missing
+
+    def build(
+        self,
+        missing: List[Tuple[int, int, List[str]]],
+        documents: Dict[str, Optional[Document]],
+    ) -> List[CorpusBuffer]:
+        """
+        Builds the blocks reported missing by get(), documents that are None
+        are left out. Meant for an executor thread, see store
+        """
+        return [
+            CorpusBuffer(
+                (path, documents[path])
+                for path in paths
+                if documents.get(path) is not None
+            )
+            for _, _, paths in missing
+        ]
+
+    def store(
+        self, missing: List[Tuple[int, int, List[str]]], buffers: List[CorpusBuffer]
+    ):
+        """
+        Keeps the blocks built from missing in the DocumentStore, from the
+        thread that owns it
+        """
+        for (block_no, version, _), buffer in zip(missing, buffers):
+            # Changed while it was built, only good for the scan at hand
+            if self.block_versions[block_no] == version:
+                DocumentStore.put(self.get_key(version), buffer, buffer.get_size())
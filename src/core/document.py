@@ -0,0 +1,111 @@
+from typing import List, NamedTuple, Tuple
+
+
+class Document(NamedTuple):
+    """
+    Everything find_in_file needs from one version of a file that does not
+    depend on the keyword. Built once at ingest time, never mutated.
+    """
+
+    path: str
+    title: str
+
+    # Non-empty lines
+    lines: Tuple[str, ...]
+
+    # Line number in the file, from 0, of every line of lines
+    line_nos: Tuple[int, ...]
+
+    # Index in lines of the first line of every chunk
+    chunk_starts: Tuple[int, ...]
+
+    chunks: Tuple[str, ...]
+
+    # Case-folded copy of chunks
+    folded_chunks: Tuple[str, ...]
+
+    @staticmethod
+    def get_title(path: str, lines: List[str]) -> str:
+        # Attempt to parse title
+        title = path
+
+        # Jekyll Markdown?
+        if path.endswith(".markdown") or path.endswith(".md"):
+            has_dashes_once = False
+
+            for line in lines:
+                if line.startswith("---"):
+                    if has_dashes_once:
+                        break
+
+                    has_dashes_once = True
+
+                # Extract page title if found
+                if line.startswith("title: "):
+                    title = line.split("title: ")[-1]
+                    break
+        elif path.endswith(".html"):
+            full_doc = "\n".join(lines)
+
+            # Now look for title
+            start_index = full_doc.find("<title>") + len("<title>")
+            end_index = full_doc.find("</title>")
+
+            # If there is indeed a title set, grab it!
+            if end_index != -1:
+                title = full_doc[start_index:end_index].strip()
+
+        return title
+
+    @classmethod
+    def from_lines(
+        cls, path: str, lines: List[str], context_length: int = 4
+    ) -> "Document":
+        # Delete empty lines
+        line_nos = tuple(i for i, line in enumerate(lines) if len(line.strip()) > 0)
+        lines = tuple(lines[i] for i in line_nos)
+        sz_lines = len(lines)
+
+        # Group lines into chunks
+        chunk_starts = tuple(range(0, sz_lines, context_length))
+        chunks = tuple(
+            "\n".join(lines[i : min(sz_lines, i + context_length)])
+            for i in chunk_starts
+        )
+
+        return cls(
+            path=path,
+            title=cls.get_title(path, lines),
+            lines=lines,
+            line_nos=line_nos,
+            chunk_starts=chunk_starts,
+            chunks=chunks,
+            folded_chunks=tuple(chunk.casefold() for chunk in chunks),
+        )
+
+    def get_chunk_span(self, chunk_idx: int) -> Tuple[int, int]:
+        """
+        [start, end) of the chunk's lines in lines
+        """
+        start = self.chunk_starts[chunk_idx]
+        end = (
+            self.chunk_starts[chunk_idx + 1]
+            if chunk_idx + 1 < len(self.chunk_starts)
+            else len(self.lines)
+        )
+
+        return start, end
+
+    def get_chunk_start(self, chunk_idx: int) -> int:
+        """
+        Line number in the file of the chunk's first line
+        """
+        return self.line_nos[self.chunk_starts[chunk_idx]]
+
+    def get_chunk_lines(self, chunk_idx: int) -> List[str]:
+        start, end = self.get_chunk_span(chunk_idx)
+        return list(self.lines[start:end])
+
+    def get_chunk_line_nos(self, chunk_idx: int) -> List[int]:
+        start, end = self.get_chunk_span(chunk_idx)
+        return list(self.line_nos[start:end])
@@ -0,0 +1,56 @@
+from typing import Dict, Optional, Tuple
+
+from src.core.document import Document
+from src.utils.sized_lru_cache import SizedLRUCache
+
+
+class DocumentStore:
+    """
+    The one cache of ingested documents, shared by all sources and bounded in
+    bytes. Keys are (absolute path, mtime_ns, size), so a new version of a
+    file never hits an old entry. Evicted documents are re-ingested from disk
+    by their SourceIndex when needed. The CorpusBlocks built from them, and
+    the lines read by SearchSys.read_file, are kept here too under their own
+    keys.
+    """
+
+    default_max_bytes = 256 * 1024 * 1024
+
+    cache: Optional[SizedLRUCache] = None
+
+    @classmethod
+    def init(cls, max_bytes: int):
+        if cls.cache is None:
+            cls.cache = SizedLRUCache(max_bytes)
+
+    @classmethod
+    def get_cache(cls) -> SizedLRUCache:
+        cls.init(cls.default_max_bytes)
+        return cls.cache
+
+    @staticmethod
+    def get_key(abs_path: str, stat: Tuple) -> Tuple[str, int, int]:
+        """
+        stat: starts with (mtime_ns, size), as recorded by ChangeTracker
+        """
+        return abs_path, stat[0], stat[1]
+
+    @classmethod
+    def get(cls, key: Tuple) -> Optional[Document]:
+        return cls.get_cache().get(key)
+
+    @classmethod
+    def peek(cls, key: Tuple) -> Optional[Document]:
+        return cls.get_cache().peek(key)
+
+    @classmethod
+    def put(cls, key: Tuple, document: Document, size: Optional[int] = None):
+        cls.get_cache().put(key, document, size)
+
+    @classmethod
+    def pop(cls, key: Tuple):
+        cls.get_cache().pop(key)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return cls.get_cache().stats()
@@ -0,0 +1,163 @@
+import functools
+import mmap
+import threading
+from typing import Iterator, List, Optional, Pattern, Tuple
+
+import numpy
+
+from src.core.document import Document
+from src.utils.sized_lru_cache import SizedLRUCache
+
+
+class MappedFile:
+    """
+    A file too large to be ingested, searched in place: the keyword is looked
+    for in the raw bytes of a read-only mmap and only the lines of the chunks
+    that matched are ever decoded. Chunks are context_length lines like
+    Document's, except that blank lines count. Lines are numbered like the
+    file's either way.
+    """
+
+    # Newline offsets of recently searched versions, keyed like DocumentStore
+    newline_tables = SizedLRUCache(64 * 1024 * 1024)
+    newline_tables_lock = threading.Lock()
+
+    # Bytes compared at once when looking for newlines
+    block_size = 1024 * 1024
+
+    # Bytes decoded to look for a title
+    title_bytes = 64 * 1024
+
+    path: str = None
+    key: Tuple = None
+    context_length: int = 4
+    data: Optional[mmap.mmap] = None
+
+    def __init__(self, path: str, abs_path: str, key: Tuple, context_length: int = 4):
+        self.path = path
+        self.key = key
+        self.context_length = context_length
+
+        with open(abs_path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, *args):
+        self.data.close()
+
+    @functools.cached_property
+    def title(self) -> str:
+        head = self.data[: self.title_bytes].decode("utf-8", errors="ignore")
+        return Document.get_title(
+            self.path, [line.strip() for line in head.split("\n")]
+        )
+
+    def get_newlines(self) -> numpy.ndarray:
+        """
+        Offsets of every b"\\n", built on first use
+        """
+        # Files are searched from executor threads
+        with self.newline_tables_lock:
+            ret = self.newline_tables.get(self.key)
+
+        if ret is None:
+            view = numpy.frombuffer(self.data, dtype=numpy.uint8)
+            ret = numpy.concatenate(
+                [numpy.zeros(0, dtype=numpy.int64)]
+                + [
+                    numpy.flatnonzero(view[i : i + self.block_size] == 10) + i
+                    for i in range(0, len(view), self.block_size)
+                ]
+            )
+            del view
+
+            with self.newline_tables_lock:
+                self.newline_tables.put(self.key, ret)
+
+        return ret
+
+    def get_chunk_idx(self, pos: int) -> int:
+        n_lines_before = int(numpy.searchsorted(self.get_newlines(), pos))
+        return n_lines_before // self.context_length
+
+    def get_chunk_span(self, chunk_idx: int) -> Tuple[int, int]:
+        newlines = self.get_newlines()
+        first_line = chunk_idx * self.context_length
+        last_line = first_line + self.context_length - 1
+
+        start = 0 if first_line == 0 else int(newlines[first_line - 1]) + 1
+        end = int(newlines[last_line]) if last_line < len(newlines) else len(self.data)
+
+        return start, end
+
+    def get_numbered_lines(self, chunk_idx: int) -> List[Tuple[int, str]]:
+        """
+        (line number in the file, line) of the non-empty lines of the chunk
+        """
+        start, end = self.get_chunk_span(chunk_idx)
+        text = self.data[start:end].decode("utf-8", errors="replace")
+        first_line = chunk_idx * self.context_length
+
+        return [
+            (first_line + i, line.strip())
+            for i, line in enumerate(text.split("\n"))
+            if len(line.strip()) > 0
+        ]
+
+    def get_chunk_start(self, chunk_idx: int) -> int:
+        # Of the first line shown, as in Document
+        numbered = self.get_numbered_lines(chunk_idx)
+        return numbered[0][0] if len(numbered) > 0 else chunk_idx * self.context_length
+
+    def get_chunk_lines(self, chunk_idx: int) -> List[str]:
+        return [line for _, line in self.get_numbered_lines(chunk_idx)]
+
+    def get_chunk_line_nos(self, chunk_idx: int) -> List[int]:
+        return [line_no for line_no, _ in self.get_numbered_lines(chunk_idx)]
+
+    def find(
+        self,
+        needle: bytes,
+        folded: Optional[Pattern] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[Tuple[int, bool]]:
+        """
+        Yields (chunk index, whether it has needle itself) of every chunk that
+        has needle, or a match of folded when given, in file order. Stops after
+        limit chunks that have needle itself.
+        """
+        pos = 0
+        n_exact = 0
+
+        while limit is None or n_exact < limit:
+            if folded is None:
+                hit = self.data.find(needle, pos)
+            else:
+                found = folded.search(self.data, pos)
+                hit = -1 if found is None else found.start()
+
+            if hit < 0:
+                return
+
+            chunk_idx = self.get_chunk_idx(hit)
+            _, end = self.get_chunk_span(chunk_idx)
+
+            # Any exact occurrence is also a folded one, so not before hit
+            is_exact = folded is None or self.data.find(needle, hit, end) != -1
+            n_exact += is_exact
+
+            yield chunk_idx, is_exact
+
+            pos = max(end, hit + 1)
+
+    def to_document(self) -> Document:
+        """
+        The whole file decoded, for matchers that cannot work on bytes
+        """
+        lines = self.data[:].decode("utf-8", errors="replace").split("\n")
+
+        return Document.from_lines(
+            self.path, [line.strip() for line in lines], self.context_length
+        )
@@ -0,0 +1,89 @@
+from typing import Dict, List, Pattern
+
+from src.core.matcher import Matcher
+
+
+class MatchGrouper:
+    """
+    Folds ranked matches into one entry per file: its metadata once, the
+    context windows around its matches (adjacent or overlapping chunks
+    merged into one) and the (line, column, length) of every hit in them.
+    Lines are numbered like the file's, from 0, and the blank lines a
+    window spans are kept empty so that its lines stay consecutive.
+    """
+
+    # Copied from the first match of every file
+    document_fields = ["path", "title", "remote_path", "source"]
+
+    @staticmethod
+    def merge_windows(windows: List[Dict], line_nos: List[int], lines: List[str]):
+        """
+        Adds the lines of a chunk, numbered by line_nos, to the last window if
+        it overlaps or touches it, to a new one otherwise
+        """
+        if len(line_nos) == 0:
+            return
+
+        if len(windows) == 0 or line_nos[0] > windows[-1]["line"] + len(
+            windows[-1]["lines"]
+        ):
+            windows.append({"line": line_nos[0], "lines": []})
+
+        window = windows[-1]
+
+        for line_no, text in zip(line_nos, lines):
+            i = line_no - window["line"]
+
+            if i >= len(window["lines"]):
+                window["lines"].extend([""] * (i - len(window["lines"])))
+                window["lines"].append(text)
+
+    @classmethod
+    def group(cls, matches: List[Dict], matcher: Matcher) -> List[Dict]:
+        """
+        Files come in the order of their best match, so a ranked list of
+        matches gives a ranked list of files
+        """
+        groups: Dict[tuple, List[Dict]] = {}
+
+        for match in matches:
+            groups.setdefault((match.get("source"), match["path"]), []).append(match)
+
+        patterns: Dict[str, Pattern] = {}
+        ret = []
+
+        for file_matches in groups.values():
+            best = file_matches[0]
+            windows = []
+            hits = set()
+
+            for match in sorted(file_matches, key=lambda match: match["line"]):
+                line_nos = match["line_nos"]
+                cls.merge_windows(windows, line_nos, match["chunk"])
+
+                keyword = match["keyword"]
+                pattern = patterns.get(keyword)
+
+                if pattern is None:
+                    pattern = patterns[keyword] = matcher.get_hit_pattern(keyword)
+
+                for line_no, text in zip(line_nos, match["chunk"]):
+                    for found in pattern.finditer(text):
+                        if found.end() > found.start():
+                            hits.add(
+                                (line_no, found.start(), found.end() - found.start())
+                            )
+
+            group = {field: best.get(field) for field in cls.document_fields}
+            group["priority"] = best["priority"]
+
+            if "score" in best:
+                group["score"] = best["score"]
+
+            group["types"] = sorted(set(match["type"] for match in file_matches))
+            group["n_matches"] = len(file_matches)
+            group["windows"] = windows
+            group["hits"] = sorted(hits)
+            ret.append(group)
+
+        return ret
@@ -0,0 +1,429 @@
+import re
+import time
+from typing import Dict, List, Optional, Pattern, Set, Tuple, Union
+
+from src.core.bm25 import BM25
+from src.core.corpus_buffer import CorpusBuffers
+from src.core.document import Document
+from src.core.mapped_file import MappedFile
+from src.core.query_parser import QueryNode, QueryParser
+from src.core.regex_plan import RegexPlan
+from src.core.term_index import TermIndex
+from src.core.trigram_index import TrigramIndex
+
+
+class Matcher:
+    """
+    One search mode: how to shortlist chunks through the index and how to
+    verify a document's shortlisted chunks. Matchers are built from the raw
+    keyword so that they can be rebuilt cheaply inside worker processes.
+    """
+
+    keyword: str = None
+
+    # Number of best matches wanted, None for all of them
+    limit: Optional[int] = None
+
+    # Whether scan_corpus can shortlist when get_candidates cannot
+    scans_corpus: bool = False
+
+    # Set once the matcher gave up on checking everything, see RegexMatcher
+    is_partial: bool = False
+
+    # Whether candidates depend on statistics of the whole source, which a
+    # shard of it does not have
+    needs_whole_index: bool = False
+
+    # Whether match_mapped can find anything in files left out of the index
+    covers_large_files: bool = True
+
+    def __init__(self, keyword: str, limit: Optional[int] = None):
+        self.keyword = keyword
+        self.limit = limit
+
+    @staticmethod
+    def create(
+        keyword: str, mode: str = "exact", limit: Optional[int] = None
+    ) -> "Matcher":
+        if mode not in MODES:
+            raise Exception(f"unknown search mode: {mode}")
+
+        return MODES[mode](keyword, limit)
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Dict[str, Set[int]]]:
+        """
+        Returns {relative path: candidate chunk indexes}, None to scan everything
+        """
+        return index.lookup(self.keyword)
+
+    def scan_corpus(self, corpus: CorpusBuffers) -> Optional[Dict[str, Set[int]]]:
+        """
+        Same as get_candidates, by scanning the source's CorpusBuffer blocks
+        """
+        return None
+
+    def make_match(
+        self,
+        doc: Union[Document, MappedFile],
+        idx: int,
+        match_type: str,
+        keyword: str,
+        priority: int,
+    ) -> Dict:
+        return {
+            "type": match_type,
+            "title": doc.title,
+            "keyword": keyword,
+            "input_keyword": self.keyword,
+            "chunk": doc.get_chunk_lines(idx),
+            "line": doc.get_chunk_start(idx),
+            "line_nos": doc.get_chunk_line_nos(idx),
+            "priority": priority,
+            "path": doc.path or "anonymous",
+        }
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        raise NotImplementedError()
+
+    @staticmethod
+    def get_words_pattern(words: List[str], whole_words: bool = False) -> Pattern:
+        # Longest first, so that a word is not cut short by one of its prefixes
+        alternatives = "|".join(
+            re.escape(word) for word in sorted(set(words), key=len, reverse=True)
+        )
+
+        if len(alternatives) == 0:
+            # Matches nothing
+            return re.compile(r"(?!)")
+
+        if whole_words:
+            alternatives = rf"\b(?:{alternatives})\b"
+
+        return re.compile(alternatives, re.IGNORECASE)
+
+    def get_hit_pattern(self, match_keyword: str) -> Pattern:
+        """
+        What to highlight in the lines of a match whose "keyword" is
+        match_keyword
+        """
+        return self.get_words_pattern([match_keyword])
+
+    def match_mapped(self, file: MappedFile) -> List[Dict]:
+        """
+        Matches a file left out of the index. Decodes it whole unless the
+        matcher can search bytes, see covers_large_files
+        """
+        return self.match_document(file.to_document())
+
+
+class ExactMatcher(Matcher):
+    """
+    Substring match, case sensitive hits rank above case insensitive ones
+    """
+
+    scans_corpus = True
+
+    def scan_corpus(self, corpus: CorpusBuffers) -> Optional[Dict[str, Set[int]]]:
+        return corpus.find(self.keyword.casefold())
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        ret = []
+
+        keyword = self.keyword
+        lower_keyword = keyword.lower()
+        folded_keyword = keyword.casefold()
+        idxes = range(len(doc.chunks)) if candidates is None else sorted(candidates)
+
+        for idx in idxes:
+            # Case sensitive
+            if keyword in doc.chunks[idx]:
+                ret.append(self.make_match(doc, idx, "exact", keyword, 0))
+            # Case insensitive, as lower() has it: casefold() also equates
+            # e.g. "ß" and "ss", so it only rules chunks out cheaply
+            elif (
+                folded_keyword in doc.folded_chunks[idx]
+                and lower_keyword in doc.chunks[idx].lower()
+            ):
+                ret.append(self.make_match(doc, idx, "bad_case", lower_keyword, 1))
+
+        return ret
+
+    def match_mapped(self, file: MappedFile) -> List[Dict]:
+        keyword = self.keyword
+
+        # Bytes only fold ASCII letters
+        if not keyword.isascii():
+            return super().match_mapped(file)
+
+        needle = keyword.encode()
+        folded = re.compile(re.escape(needle), re.IGNORECASE)
+
+        return [
+            (
+                self.make_match(file, idx, "exact", keyword, 0)
+                if is_exact
+                else self.make_match(file, idx, "bad_case", keyword.lower(), 1)
+            )
+            for idx, is_exact in file.find(needle, folded, self.limit)
+        ]
+
+
+class QueryMatcher(Matcher):
+    """
+    AND/OR/NOT and "quoted phrases", see QueryParser
+    """
+
+    plan: QueryNode = None
+
+    def __init__(self, keyword: str, limit: Optional[int] = None):
+        super().__init__(keyword, limit)
+        self.plan = QueryParser.parse(keyword)
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Dict[str, Set[int]]]:
+        chunk_ids = self.plan.get_candidates(index)
+
+        return None if chunk_ids is None else index.group_ids(chunk_ids)
+
+    def get_hit_pattern(self, match_keyword: str) -> Pattern:
+        return self.get_words_pattern(self.plan.get_terms())
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        idxes = range(len(doc.chunks)) if candidates is None else sorted(candidates)
+
+        return [
+            self.make_match(doc, idx, "query", self.keyword, 0)
+            for idx in idxes
+            if self.plan.matches(doc.folded_chunks[idx])
+        ]
+
+
+class RegexMatcher(Matcher):
+    """
+    Python regular expressions, case sensitive unless the pattern says (?i).
+    Chunks are shortlisted by the literals the pattern requires. Matching
+    stops once it spent its budget, and what was found so far is partial.
+    """
+
+    # Time a single query may spend in the regex engine, per worker
+    budget_ms: float = 1000.0
+
+    pattern: Pattern = None
+    required: QueryNode = None
+
+    # Starts with the first chunk matched, None until then
+    deadline: Optional[float] = None
+
+    def __init__(self, keyword: str, limit: Optional[int] = None):
+        super().__init__(keyword, limit)
+        self.pattern = RegexPlan.compile(keyword)
+        self.required = RegexPlan.get_required(keyword)
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Dict[str, Set[int]]]:
+        chunk_ids = self.required.get_candidates(index)
+
+        return None if chunk_ids is None else index.group_ids(chunk_ids)
+
+    def get_hit_pattern(self, match_keyword: str) -> Pattern:
+        # Only hits within a line are found
+        return self.pattern
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        ret = []
+        idxes = range(len(doc.chunks)) if candidates is None else sorted(candidates)
+
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.budget_ms / 1000.0
+
+        for idx in idxes:
+            remaining = self.deadline - time.monotonic()
+
+            if remaining <= 0:
+                self.is_partial = True
+                break
+
+            try:
+                found = RegexPlan.search(self.pattern, doc.chunks[idx], remaining)
+            except TimeoutError:
+                self.is_partial = True
+                break
+
+            if found is not None:
+                ret.append(self.make_match(doc, idx, "regex", found.group(0), 0))
+
+        return ret
+
+
+class BM25Matcher(Matcher):
+    """
+    Chunks that contain any word of the keyword, ranked by BM25 relevance.
+    Only the best limit chunks are kept when a limit is given.
+    """
+
+    needs_whole_index = True
+
+    # Large files have no term statistics to be scored with
+    covers_large_files = False
+
+    terms: List[str] = None
+
+    # (relative path, chunk index) -> score of the chunks kept
+    scores: Dict[Tuple[str, int], float] = None
+
+    def __init__(self, keyword: str, limit: Optional[int] = None):
+        super().__init__(keyword, limit)
+        self.terms = TermIndex.tokenize(keyword.casefold())
+        self.scores = {}
+
+        if len(self.terms) == 0:
+            raise Exception(f"no words to rank in keyword: {keyword}")
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Dict[str, Set[int]]]:
+        chunk_ids, scores = BM25.top_k(*BM25.score(index.terms, self.terms), self.limit)
+
+        self.scores = {}
+        ret: Dict[str, Set[int]] = {}
+
+        for chunk_id, score in zip(chunk_ids.tolist(), scores.tolist()):
+            ref = index.get_chunk_ref(chunk_id)
+
+            # Orphans stay in the postings until the refresh purges them
+            if ref is not None:
+                self.scores[ref] = score
+                ret.setdefault(ref[0], set()).add(ref[1])
+
+        return ret
+
+    def get_hit_pattern(self, match_keyword: str) -> Pattern:
+        return self.get_words_pattern(self.terms, whole_words=True)
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        ret = []
+
+        for idx in sorted(candidates or []):
+            match = self.make_match(doc, idx, "bm25", self.keyword, 0)
+            match["score"] = self.scores.get((doc.path, idx), 0.0)
+            ret.append(match)
+
+        return ret
+
+
+class FuzzyMatcher(Matcher):
+    """
+    Chunks that contain, for every word of the keyword, a word within
+    threshold trigram similarity of it. Chunks with only exact words rank
+    first, the others by how close their words are.
+    """
+
+    # Set from the configuration, see get_threshold
+    threshold: float = 0.4
+
+    # The words of large files are not in the term dictionary
+    covers_large_files = False
+
+    terms: List[str] = None
+
+    # query term -> {similar indexed term: similarity}
+    expansions: Dict[str, Dict[str, float]] = None
+
+    def __init__(self, keyword: str, limit: Optional[int] = None):
+        super().__init__(keyword, limit)
+        self.terms = list(dict.fromkeys(TermIndex.tokenize(keyword.casefold())))
+        self.expansions = {}
+
+        if len(self.terms) == 0:
+            raise Exception(f"no words to match in keyword: {keyword}")
+
+    @classmethod
+    def get_threshold(cls, term: str) -> float:
+        """
+        threshold, lowered for short terms so that one edit still clears it:
+        a substitution changes 3 of their len(term) + 1 trigrams
+        """
+        return min(cls.threshold, max((len(term) - 2) / (len(term) + 4), 0.25))
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Dict[str, Set[int]]]:
+        terms = index.terms
+        chunk_ids = None
+
+        for term in self.terms:
+            expansion = {}
+            found = set()
+
+            for similar, similarity in terms.dictionary.find_similar(
+                term, self.get_threshold(term)
+            ):
+                posting = terms.get_posting(similar)
+
+                # The dictionary keeps terms that are no longer in any chunk
+                if posting is not None:
+                    expansion[similar] = similarity
+                    found.update(posting[0].tolist())
+
+            self.expansions[term] = expansion
+
+            chunk_ids = found if chunk_ids is None else chunk_ids & found
+
+            if len(chunk_ids) == 0:
+                break
+
+        return index.group_ids(chunk_ids)
+
+    def get_hit_pattern(self, match_keyword: str) -> Pattern:
+        # The similar words this chunk was matched by
+        return self.get_words_pattern(match_keyword.split(), whole_words=True)
+
+    def match_document(
+        self, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        ret = []
+
+        for idx in sorted(candidates or []):
+            words = set(TermIndex.tokenize(doc.folded_chunks[idx]))
+            best = []
+
+            for term in self.terms:
+                found = [
+                    (similarity, similar)
+                    for similar, similarity in self.expansions.get(term, {}).items()
+                    if similar in words
+                ]
+
+                if len(found) == 0:
+                    break
+
+                best.append(max(found))
+
+            if len(best) < len(self.terms):
+                continue
+
+            score = sum(similarity for similarity, _ in best) / len(best)
+            match = self.make_match(
+                doc,
+                idx,
+                "fuzzy",
+                " ".join(similar for _, similar in best),
+                0 if score >= 1.0 else 1,
+            )
+            match["score"] = score
+            ret.append(match)
+
+        return ret
+
+
+MODES = {
+    "exact": ExactMatcher,
+    "query": QueryMatcher,
+    "regex": RegexMatcher,
+    "bm25": BM25Matcher,
+    "fuzzy": FuzzyMatcher,
+}
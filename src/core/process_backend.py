@@ -0,0 +1,249 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from src.core.corpus_buffer import CorpusBlocks, CorpusBuffers
+from src.core.document import Document
+from src.core.matcher import FuzzyMatcher, Matcher
+from src.core.source_index import SourceIndex
+from src.core.trigram_index import TrigramIndex
+from src.utils.util import Util
+
+# Worker side: source key -> (relative path -> document, trigram index of them,
+# relative paths in walk order)
+_shards: Dict[Tuple, Tuple[Dict[str, Document], TrigramIndex, List[str]]] = {}
+
+# Worker side: source key -> CorpusBlocks of its shard
+_corpora: Dict[Tuple, CorpusBlocks] = {}
+
+
+def _init_worker(fuzzy_threshold: float):
+    # Workers are spawned, they do not see what the configuration changed
+    FuzzyMatcher.threshold = fuzzy_threshold
+
+
+def _apply_shard(
+    key: Tuple, upserts: Dict[str, Document], removed: List[str], order: List[str]
+):
+    documents, index, _ = _shards.get(key, ({}, TrigramIndex(), []))
+    _shards[key] = (documents, index, order)
+    corpus = _corpora.setdefault(key, CorpusBlocks())
+
+    for path in removed + list(upserts.keys()):
+        if path in documents:
+            index.remove_document(path, documents.pop(path).folded_chunks)
+            corpus.update(path)
+
+    for path, document in upserts.items():
+        documents[path] = document
+        index.add_document(path, document.folded_chunks)
+        corpus.update(path, sum(len(chunk) + 1 for chunk in document.folded_chunks))
+
+
+def _match_shard(
+    key: Tuple, keyword: str, limit: Optional[int] = None, mode: str = "exact"
+) -> Tuple[Dict[str, List[Dict]], bool]:
+    """
+    ({relative path: matches}, whether the matcher gave up early)
+    """
+    matcher = Matcher.create(keyword, mode, limit)
+
+    documents, index, order = _shards.get(key, ({}, None, []))
+    candidates = None if index is None else matcher.get_candidates(index)
+
+    if candidates is None and matcher.scans_corpus and key in _corpora:
+        buffers, missing = _corpora[key].get()
+        built = _corpora[key].build(missing, documents)
+
+        # A worker runs one task at a time, its DocumentStore has no other user
+        _corpora[key].store(missing, built)
+        buffers += built
+        candidates = matcher.scan_corpus(CorpusBuffers(buffers))
+    paths = order if candidates is None else [p for p in order if p in candidates]
+
+    ret = {}
+    n_exact = 0
+
+    for path in paths:
+        if limit is not None and n_exact >= limit:
+            break
+
+        if matcher.is_partial:
+            break
+
+        matches = matcher.match_document(
+            documents[path], None if candidates is None else candidates[path]
+        )
+
+        if len(matches) > 0:
+            ret[path] = matches
+            n_exact += sum(1 for match in matches if match["priority"] == 0)
+
+    return ret, matcher.is_partial
+
+
+class ProcessBackend:
+    """
+    Runs matching in a set of single-process executors. Every executor owns a
+    long-lived shard of each source's documents, kept in sync incrementally,
+    so a query only ships the keyword in and the matches out.
+    """
+
+    executors: Optional[List[ProcessPoolExecutor]] = None
+
+    # source key -> (generation, relative path -> DocumentStore key) last
+    # shipped to workers
+    synced: Dict[Tuple, Tuple[int, Dict[str, Tuple]]] = {}
+
+    __lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def init(cls, n_processes: Optional[int] = None):
+        if cls.executors is not None:
+            return
+
+        n_processes = n_processes or os.cpu_count() or 1
+        context = multiprocessing.get_context("spawn")
+
+        # One process per executor so that each shard always lands on the same worker
+        cls.executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(FuzzyMatcher.threshold,),
+            )
+            for _ in range(n_processes)
+        ]
+        cls.__lock = asyncio.Lock()
+
+        Util.info(f"process backend started with {n_processes} workers")
+
+    @classmethod
+    def ensure_backend(cls, backend: str):
+        """
+        Refuses backends a search cannot run on: the workers are only started
+        when the configuration asks for them
+        """
+        if backend not in ["thread", "process"]:
+            raise Exception(f"unknown backend: {backend}")
+
+        if backend == "process" and cls.executors is None:
+            raise Exception('backend "process" is not enabled in the configuration')
+
+    @classmethod
+    def shutdown(cls):
+        if cls.executors is None:
+            return
+
+        for executor in cls.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        cls.executors = None
+        cls.synced = {}
+
+    @classmethod
+    def get_shard_no(cls, path: str) -> int:
+        return zlib.crc32(path.encode()) % len(cls.executors)
+
+    @classmethod
+    async def sync(cls, key: Tuple, source: SourceIndex):
+        """
+        Ships documents that changed since the last sync to their workers
+        """
+        async with cls.__lock:
+            generation, shipped = cls.synced.get(key, (-1, {}))
+
+            if generation == source.generation:
+                return
+
+            # What is shipped is what the index holds now, a refresh may run
+            # while the documents are loaded
+            generation = source.generation
+            paths = source.get_paths()
+            keys = dict(zip(paths, source.get_keys(paths)))
+
+            n_shards = len(cls.executors)
+            upserts: List[Dict[str, Document]] = [{} for _ in range(n_shards)]
+            removed: List[List[str]] = [[] for _ in range(n_shards)]
+            orders: List[List[str]] = [[] for _ in range(n_shards)]
+
+            changed = [path for path in paths if shipped.get(path) != keys[path]]
+            documents = await source.get_documents(
+                changed, [keys[path] for path in changed]
+            )
+
+            for path, document in zip(changed, documents):
+                if document is None:
+                    # Replaced since, shipped with the next generation
+                    del keys[path]
+                    continue
+
+                upserts[cls.get_shard_no(path)][path] = document
+
+            for path in paths:
+                if path in keys:
+                    orders[cls.get_shard_no(path)].append(path)
+
+            for path in shipped:
+                if path not in keys:
+                    removed[cls.get_shard_no(path)].append(path)
+
+            loop = asyncio.get_running_loop()
+
+            await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        executor,
+                        functools.partial(
+                            _apply_shard,
+                            key,
+                            upserts[shard_no],
+                            removed[shard_no],
+                            orders[shard_no],
+                        ),
+                    )
+                    for shard_no, executor in enumerate(cls.executors)
+                ]
+            )
+
+            cls.synced[key] = (generation, keys)
+
+    @classmethod
+    async def iter_find(
+        cls,
+        key: Tuple,
+        source: SourceIndex,
+        keyword: str,
+        limit: Optional[int] = None,
+        mode: str = "exact",
+    ) -> AsyncIterator[Tuple[Dict[str, List[Dict]], bool]]:
+        """
+        Yields ({relative path: matches}, whether the matcher gave up early)
+        of every shard as soon as it is done.
+        The workers must have been started with init(), see ensure_backend.
+        """
+
+        # Finishes even if the search is cancelled, so shards stay in step
+        await asyncio.shield(cls.sync(key, source))
+
+        loop = asyncio.get_running_loop()
+
+        futures = [
+            loop.run_in_executor(
+                executor, functools.partial(_match_shard, key, keyword, limit, mode)
+            )
+            for executor in cls.executors
+        ]
+
+        try:
+            for future in asyncio.as_completed(futures):
+                yield await future
+        finally:
+            # Shards not started yet are dropped when the caller gives up
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,237 @@
+import re
+from typing import List, Optional, Set
+
+from src.core.trigram_index import TrigramIndex
+
+
+class QueryNode:
+    """
+    A node of a parsed query plan. Every node can narrow the chunks to look at
+    through the index, then tell whether a case-folded chunk satisfies it.
+    """
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Set[int]]:
+        """
+        Chunk ids that may match, None when the index cannot narrow this node
+        """
+        raise NotImplementedError()
+
+    def matches(self, folded_chunk: str) -> bool:
+        raise NotImplementedError()
+
+    def get_terms(self) -> List[str]:
+        """
+        Terms and phrases a matching chunk may contain, for highlighting
+        """
+        raise NotImplementedError()
+
+
+class TermNode(QueryNode):
+    text: str = None
+    folded: str = None
+
+    def __init__(self, text: str):
+        self.text = text
+        self.folded = text.casefold()
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Set[int]]:
+        return index.lookup_ids(self.folded)
+
+    def matches(self, folded_chunk: str) -> bool:
+        return self.folded in folded_chunk
+
+    def get_terms(self) -> List[str]:
+        return [self.text]
+
+    def __repr__(self):
+        return f"Term({self.text!r})"
+
+
+class PhraseNode(TermNode):
+    def __repr__(self):
+        return f"Phrase({self.text!r})"
+
+
+class AndNode(QueryNode):
+    children: List[QueryNode] = None
+
+    def __init__(self, children: List[QueryNode]):
+        self.children = children
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Set[int]]:
+        narrowed = [
+            candidates
+            for candidates in (child.get_candidates(index) for child in self.children)
+            if candidates is not None
+        ]
+
+        if len(narrowed) == 0:
+            return None
+
+        # Most selective first, so the query costs about as much as its rarest term
+        narrowed.sort(key=len)
+        ret = set(narrowed[0])
+
+        for candidates in narrowed[1:]:
+            if len(ret) == 0:
+                break
+            ret &= candidates
+
+        return ret
+
+    def matches(self, folded_chunk: str) -> bool:
+        return all(child.matches(folded_chunk) for child in self.children)
+
+    def get_terms(self) -> List[str]:
+        return [term for child in self.children for term in child.get_terms()]
+
+    def __repr__(self):
+        return f"And({', '.join(repr(child) for child in self.children)})"
+
+
+class OrNode(AndNode):
+    def get_candidates(self, index: TrigramIndex) -> Optional[Set[int]]:
+        ret = set()
+
+        for child in self.children:
+            candidates = child.get_candidates(index)
+
+            # One unbounded branch makes the whole union unbounded
+            if candidates is None:
+                return None
+
+            ret |= candidates
+
+        return ret
+
+    def matches(self, folded_chunk: str) -> bool:
+        return any(child.matches(folded_chunk) for child in self.children)
+
+    def __repr__(self):
+        return f"Or({', '.join(repr(child) for child in self.children)})"
+
+
+class NotNode(QueryNode):
+    child: QueryNode = None
+
+    def __init__(self, child: QueryNode):
+        self.child = child
+
+    def get_candidates(self, index: TrigramIndex) -> Optional[Set[int]]:
+        # Trigram candidates are a superset, their complement proves nothing
+        return None
+
+    def matches(self, folded_chunk: str) -> bool:
+        return not self.child.matches(folded_chunk)
+
+    def get_terms(self) -> List[str]:
+        # Found nowhere in a matching chunk
+        return []
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+
+class QueryParser:
+    """
+    Parses queries like:
+
+        foo bar                 both terms (AND is implied)
+        foo OR bar              either term
+        "foo bar" NOT baz       the phrase, without baz
+        (foo OR bar) AND baz    grouping
+
+    Operators must be upper case, anything else is a term. Terms and phrases
+    are matched case-insensitively within a chunk.
+    """
+
+    token_pattern = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+)|(\S))')
+
+    tokens: List = None
+    pos: int = 0
+
+    def __init__(self, query: str):
+        self.tokens = []
+        self.pos = 0
+
+        for match in self.token_pattern.finditer(query.strip()):
+            l_paren, r_paren, phrase, word, junk = match.groups()
+
+            if junk is not None:
+                raise Exception(f"unterminated phrase in query: {query}")
+            elif l_paren is not None:
+                self.tokens.append(("(", None))
+            elif r_paren is not None:
+                self.tokens.append((")", None))
+            elif phrase is not None:
+                self.tokens.append(("phrase", re.sub(r"\\(.)", r"\1", phrase)))
+            elif word in ("AND", "OR", "NOT"):
+                self.tokens.append((word, None))
+            else:
+                self.tokens.append(("term", word))
+
+    @classmethod
+    def parse(cls, query: str) -> QueryNode:
+        parser = cls(query)
+
+        if len(parser.tokens) == 0:
+            raise Exception("empty query")
+
+        ret = parser.parse_or()
+
+        if parser.pos != len(parser.tokens):
+            raise Exception(f"unexpected {parser.peek()} in query: {query}")
+
+        return ret
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse_or(self) -> QueryNode:
+        children = [self.parse_and()]
+
+        while self.peek() == "OR":
+            self.pos += 1
+            children.append(self.parse_and())
+
+        return children[0] if len(children) == 1 else OrNode(children)
+
+    def parse_and(self) -> QueryNode:
+        children = [self.parse_not()]
+
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.pos += 1
+
+            children.append(self.parse_not())
+
+        return children[0] if len(children) == 1 else AndNode(children)
+
+    def parse_not(self) -> QueryNode:
+        if self.peek() == "NOT":
+            self.pos += 1
+            return NotNode(self.parse_not())
+
+        return self.parse_atom()
+
+    def parse_atom(self) -> QueryNode:
+        if self.pos >= len(self.tokens):
+            raise Exception("query ends unexpectedly")
+
+        kind, value = self.tokens[self.pos]
+        self.pos += 1
+
+        if kind == "term":
+            return TermNode(value)
+        elif kind == "phrase":
+            return PhraseNode(value)
+        elif kind == "(":
+            ret = self.parse_or()
+
+            if self.peek() != ")":
+                raise Exception("missing ) in query")
+
+            self.pos += 1
+            return ret
+
+        raise Exception(f"unexpected {kind} in query")
@@ -0,0 +1,251 @@
+import functools
+import re
+from typing import List, Match, Optional, Pattern, Set
+
+from src.core.query_parser import AndNode, OrNode, QueryNode, TermNode
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parser
+except ImportError:
+    # Before Python 3.11
+    import sre_constants
+    import sre_parser
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+# Widest character range whose characters are listed, see get_class_chars
+_MAX_RANGE = 256
+
+
+class RegexPlan:
+    """
+    Compiles user patterns and derives the literal fragments any match must
+    contain, so the trigram index can drop chunks before the regex engine runs.
+
+    Patterns are compiled with the regex package when it is installed, whose
+    searches can be given a timeout. re cannot be stopped mid-match, so
+    without it the patterns that make it backtrack the most are refused.
+    """
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def compile(pattern: str) -> Pattern:
+        try:
+            parsed = sre_parser.parse(pattern)
+
+            if regex is not None:
+                return regex.compile(pattern)
+        except (re.error, getattr(regex, "error", re.error)) as e:
+            raise Exception(f"bad regex {pattern}: {e}")
+
+        if RegexPlan.has_nested_repeat(parsed, False):
+            raise Exception(
+                f"regex {pattern} nests unbounded repeats, which can backtrack forever"
+            )
+
+        if RegexPlan.has_ambiguous_branch(list(parsed), set(), False):
+            raise Exception(
+                f"regex {pattern} repeats alternatives that can start alike,"
+                " which can backtrack forever"
+            )
+
+        return re.compile(pattern)
+
+    @staticmethod
+    def search(pattern: Pattern, text: str, timeout: float) -> Optional[Match]:
+        """
+        pattern.search(text), raising TimeoutError past timeout seconds when
+        the pattern was compiled by the regex package
+        """
+        if regex is not None and isinstance(pattern, regex.Pattern):
+            return pattern.search(text, timeout=timeout)
+
+        return pattern.search(text)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def get_required(pattern: str) -> QueryNode:
+        """
+        A plan of literals that every match contains, e.g. foo(bar|baz)+ gives
+        And(foo, Or(bar, baz)). Parts that guarantee nothing are left out.
+        """
+        return RegexPlan.get_sequence_required(list(sre_parser.parse(pattern)))
+
+    @staticmethod
+    def is_unbounded(op, av) -> bool:
+        return (op in _REPEATS or op == _POSSESSIVE_REPEAT) and (
+            av[1] == sre_constants.MAXREPEAT
+        )
+
+    @staticmethod
+    def has_nested_repeat(items, in_repeat: bool) -> bool:
+        for op, av in items:
+            if op in _REPEATS or op == _POSSESSIVE_REPEAT:
+                unbounded = RegexPlan.is_unbounded(op, av)
+
+                if unbounded and in_repeat:
+                    return True
+
+                if RegexPlan.has_nested_repeat(av[2], in_repeat or unbounded):
+                    return True
+            elif op == sre_constants.SUBPATTERN:
+                if RegexPlan.has_nested_repeat(av[3], in_repeat):
+                    return True
+            elif op == sre_constants.BRANCH:
+                for branch in av[1]:
+                    if RegexPlan.has_nested_repeat(branch, in_repeat):
+                        return True
+
+        return False
+
+    @staticmethod
+    def union(a: Optional[Set[str]], b: Optional[Set[str]]) -> Optional[Set[str]]:
+        return None if a is None or b is None else a | b
+
+    @staticmethod
+    def get_class_chars(items) -> Optional[Set[str]]:
+        ret = set()
+
+        for op, av in items:
+            if op == sre_constants.LITERAL:
+                ret.add(chr(av).lower())
+            elif op == sre_constants.RANGE and av[1] - av[0] < _MAX_RANGE:
+                ret.update(chr(c).lower() for c in range(av[0], av[1] + 1))
+            else:
+                return None
+
+        return ret
+
+    @staticmethod
+    def get_first_chars(items: List, follow: Optional[Set[str]]) -> Optional[Set[str]]:
+        """
+        Lowercase characters a match of items can start with, given the ones
+        of what comes after them (an empty set for the end of the pattern).
+        None when that is too wide to tell, e.g. for \\w or any character.
+        """
+        for i, (op, av) in enumerate(items):
+            if op == sre_constants.LITERAL:
+                return {chr(av).lower()}
+            elif op == sre_constants.IN:
+                return RegexPlan.get_class_chars(av)
+            elif op == sre_constants.AT:
+                # Anchors match no character
+                continue
+
+            rest = RegexPlan.get_first_chars(items[i + 1 :], follow)
+
+            if op == sre_constants.SUBPATTERN:
+                return RegexPlan.get_first_chars(list(av[3]), rest)
+            elif op == _ATOMIC_GROUP:
+                return RegexPlan.get_first_chars(list(av), rest)
+            elif op == sre_constants.BRANCH:
+                ret = set()
+
+                for branch in av[1]:
+                    ret = RegexPlan.union(
+                        ret, RegexPlan.get_first_chars(list(branch), rest)
+                    )
+
+                return ret
+            elif op in _REPEATS or op == _POSSESSIVE_REPEAT:
+                ret = RegexPlan.get_first_chars(list(av[2]), rest)
+
+                return ret if av[0] >= 1 else RegexPlan.union(ret, rest)
+
+            return None
+
+        return follow
+
+    @staticmethod
+    def has_ambiguous_branch(
+        items: List, follow: Optional[Set[str]], in_repeat: bool
+    ) -> bool:
+        """
+        Whether an unbounded repeat has alternatives that can start with the
+        same character, such as (a|aa)*, which re tries every way to split
+        the text between
+        """
+        for i, (op, av) in enumerate(items):
+            rest = RegexPlan.get_first_chars(items[i + 1 :], follow)
+
+            if op in _REPEATS or op == _POSSESSIVE_REPEAT:
+                unbounded = RegexPlan.is_unbounded(op, av)
+                body = list(av[2])
+
+                # The end of the body is followed by the body again
+                loop = RegexPlan.union(RegexPlan.get_first_chars(body, rest), rest)
+
+                if RegexPlan.has_ambiguous_branch(body, loop, in_repeat or unbounded):
+                    return True
+            elif op == sre_constants.SUBPATTERN:
+                if RegexPlan.has_ambiguous_branch(list(av[3]), rest, in_repeat):
+                    return True
+            elif op == sre_constants.BRANCH:
+                firsts = [
+                    RegexPlan.get_first_chars(list(branch), rest) for branch in av[1]
+                ]
+
+                if in_repeat:
+                    seen = set()
+
+                    for first in firsts:
+                        if first is None or len(seen & first) > 0:
+                            return True
+
+                        seen |= first
+
+                for branch in av[1]:
+                    if RegexPlan.has_ambiguous_branch(list(branch), rest, in_repeat):
+                        return True
+
+        return False
+
+    @staticmethod
+    def get_sequence_required(items: List) -> QueryNode:
+        children: List[QueryNode] = []
+        run: List[str] = []
+
+        def flush():
+            if len(run) > 0:
+                children.append(TermNode("".join(run)))
+                run.clear()
+
+        for op, av in items:
+            if op == sre_constants.LITERAL:
+                run.append(chr(av))
+                continue
+
+            flush()
+            child = RegexPlan.get_item_required(op, av)
+
+            # An empty And() requires nothing
+            if child is not None and not (
+                type(child) is AndNode and len(child.children) == 0
+            ):
+                children.append(child)
+
+        flush()
+
+        return children[0] if len(children) == 1 else AndNode(children)
+
+    @staticmethod
+    def get_item_required(op, av) -> Optional[QueryNode]:
+        if op == sre_constants.SUBPATTERN:
+            return RegexPlan.get_sequence_required(list(av[3]))
+        elif op == _ATOMIC_GROUP:
+            return RegexPlan.get_sequence_required(list(av))
+        elif (op in _REPEATS or op == _POSSESSIVE_REPEAT) and av[0] >= 1:
+            return RegexPlan.get_sequence_required(list(av[2]))
+        elif op == sre_constants.BRANCH:
+            return OrNode([RegexPlan.get_sequence_required(list(b)) for b in av[1]])
+
+        # Classes, anchors, lookarounds, backreferences... guarantee no literal
+        return None
@@ -0,0 +1,60 @@
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.sized_lru_cache import SizedLRUCache
+
+
+class ResultCache:
+    """
+    Ranked matches of recent searches. Keys carry the generation of every
+    source searched, so a file change makes the old entries unreachable
+    instead of waiting for a TTL; LRU eviction then reclaims them.
+    """
+
+    cache: Optional[SizedLRUCache] = None
+
+    @classmethod
+    def init(cls, max_bytes: int):
+        if cls.cache is None:
+            cls.cache = SizedLRUCache(max_bytes)
+
+    @staticmethod
+    def get_key(
+        keyword: str, mode: str, sources: List[Tuple], generations: List[int]
+    ) -> Tuple:
+        # Whitespace only matters to exact and regex matching
+        if mode not in ("exact", "regex"):
+            keyword = " ".join(keyword.split())
+
+        return keyword, mode, tuple(sources), tuple(generations)
+
+    @classmethod
+    def get(cls, key: Tuple, n_wanted: Optional[int]) -> Optional[List[Dict]]:
+        """
+        n_wanted: how many top matches the caller needs, None for all of them
+        """
+        if cls.cache is None:
+            return None
+
+        entry = cls.cache.get(key)
+
+        if entry is None:
+            return None
+
+        n_cached, matches = entry
+
+        # Cached from a search that stopped before n_wanted matches
+        if n_cached is not None and (n_wanted is None or n_wanted > n_cached):
+            cls.cache.hits -= 1
+            cls.cache.misses += 1
+            return None
+
+        return matches
+
+    @classmethod
+    def put(cls, key: Tuple, n_wanted: Optional[int], matches: List[Dict]):
+        if cls.cache is not None:
+            cls.cache.put(key, (n_wanted, matches))
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return {} if cls.cache is None else cls.cache.stats()
@@ -1,35 +1,64 @@
 from ast import Dict
 import functools
-import string
-from typing import List, AnyStr, Optional
+import os
+import time
+from typing import List, AnyStr, Optional, Set, AsyncIterator
 import asyncio
 import aiocache
 
+from src.core.document import Document
+from src.core.document_store import DocumentStore
+from src.core.matcher import ExactMatcher, Matcher
+from src.core.process_backend import ProcessBackend
+from src.core.shared_corpus import SharedCorpus, SharedSource
+from src.core.snapshot import Snapshot
+from src.core.source_index import SourceIndex
+from src.utils.file_walker import FileWalker
+from src.utils.metrics import Metrics
 from src.utils.util import Util
 
 
 class SearchSys:
+    # (root, extensions) -> live index of that source
+    sources: Dict = {}
+
+    # Set in HTTP workers that map the corpora another process publishes
+    # there instead of indexing the sources themselves, see SharedCorpus
+    shared_dir: Optional[str] = None
+
+    # (root, extensions) -> generation last published by this process
+    published: Dict = {}
+
     @classmethod
     @aiocache.cached(
         ttl=300, key_builder=lambda *args, **kwargs: Util.func_hash(*args, **kwargs)
     )
     async def get_file_paths(cls, root: str) -> Dict:
-        abs_paths: List[str] = []
-        Util.get_file_paths(abs_paths, root)
+        walker = FileWalker(root)
 
-        return {path.split(root)[1]: path for path in abs_paths}
+        return await Util.sync_to_async(
+            lambda: {path: root + path for path, _ in walker.walk(with_stat=False)}
+        )
 
     @classmethod
-    @aiocache.cached(
-        ttl=600, key_builder=lambda *args, **kwargs: Util.func_hash(*args, **kwargs)
-    )
-    async def read_file(cls, abs_path):
-        return await Util.sync_to_async(functools.partial(Util.read_txt, abs_path))
+    async def read_file(cls, abs_path) -> List[str]:
+        """
+        Every line of a file, cached in the DocumentStore
+        """
+        st = await Util.sync_to_async(functools.partial(os.stat, abs_path))
+        key = ("lines",) + DocumentStore.get_key(
+            abs_path, (st.st_mtime_ns, st.st_size, st.st_ino)
+        )
+        lines = DocumentStore.get(key)
+
+        if lines is None:
+            lines = await Util.sync_to_async(functools.partial(Util.read_txt, abs_path))
+            lines = tuple(lines)
+            DocumentStore.put(key, lines)
+
+        return list(lines)
 
     @classmethod
-    @aiocache.cached(
-        ttl=600, key_builder=lambda *args, **kwargs: Util.func_hash(*args, **kwargs)
-    )
     async def read_all(cls, paths: List[str]) -> Dict:
         """
         Reads all files in parallel!
@@ -39,168 +68,377 @@ class SearchSys:
 
         return {path: content for path, content in zip(paths, contents)}
 
+    @staticmethod
+    def get_source_key(root: str, file_extensions: Optional[List[str]] = None):
+        return (root, None if file_extensions is None else tuple(file_extensions))
+
+    @classmethod
+    def get_source(
+        cls,
+        root: str,
+        file_extensions: Optional[List[str]] = None,
+        excludes: Optional[List[str]] = None,
+    ) -> SourceIndex:
+        """
+        excludes: gitignore-style rules of files to leave out, applied from
+        the next scan on when the source already exists
+        """
+        key = cls.get_source_key(root, file_extensions)
+
+        if key not in cls.sources and cls.shared_dir is not None:
+            cls.sources[key] = SharedSource(
+                cls.shared_dir, root, file_extensions, context_length=4
+            )
+        elif key not in cls.sources:
+            cls.sources[key] = SourceIndex(
+                root, file_extensions, context_length=4, excludes=excludes
+            )
+        elif excludes is not None:
+            cls.sources[key].tracker.excludes = excludes
+
+        return cls.sources[key]
+
+    @classmethod
+    async def load_snapshot(
+        cls, snapshot_dir: str, root: str, file_extensions: Optional[List[str]] = None
+    ) -> bool:
+        key = cls.get_source_key(root, file_extensions)
+
+        try:
+            state = await Util.sync_to_async(
+                functools.partial(Snapshot.read, snapshot_dir, key)
+            )
+        except Exception as e:
+            # A broken snapshot only costs a cold start
+            Util.warn(f"cannot load snapshot of {root}: {Util.get_proper_msg(e)}")
+            return False
+
+        return state is not None and Snapshot.apply(
+            state, cls.get_source(root, file_extensions)
+        )
+
+    @classmethod
+    async def save_snapshots(cls, snapshot_dir: str):
+        for key, source in cls.sources.items():
+            try:
+                # Pickled on the executor, the event loop keeps serving meanwhile
+                data = await source.run_exclusive(
+                    functools.partial(Snapshot.dump, key, source)
+                )
+                await Util.sync_to_async(
+                    functools.partial(Snapshot.write, snapshot_dir, key, data)
+                )
+            except Exception as e:
+                Util.warn(f"cannot save snapshot of {key[0]}: {Util.get_proper_msg(e)}")
+
+    @classmethod
+    async def publish_shared(cls, shared_dir: str):
+        """
+        Writes the sources that changed since they were last published
+        """
+        for key, source in list(cls.sources.items()):
+            if source.is_shared or cls.published.get(key) == source.generation:
+                continue
+
+            try:
+                generation, paths, documents, large = await source.get_generation()
+                await Util.sync_to_async(
+                    functools.partial(
+                        SharedCorpus.write,
+                        shared_dir,
+                        key,
+                        source.context_length,
+                        paths,
+                        documents,
+                        large,
+                    )
+                )
+                cls.published[key] = generation
+            except Exception as e:
+                Util.warn(f"cannot publish {key[0]}: {Util.get_proper_msg(e)}")
+
     @classmethod
     def find_in_file(
         cls, keyword: str, lines: List[str], context_length: 32, path: Optional[str]
     ) -> List[Dict]:
-        ret = []
+        return cls.match_document(
+            keyword, Document.from_lines(path, lines, context_length)
+        )
+
+    @staticmethod
+    def get_rank(entry: Dict):
+        """
+        Sort key of matches: priority first, then relevance when it was scored
+        """
+        return entry["priority"], -entry.get("score", 0.0)
+
+    @classmethod
+    def match_document(
+        cls, keyword: str, doc: Document, candidates: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        """
+        candidates: chunk indexes shortlisted by the index, None to check all
+        """
+        return ExactMatcher(keyword).match_document(doc, candidates)
+
+    @staticmethod
+    def is_past(deadline: Optional[float], stats: Optional[Dict] = None) -> bool:
+        if deadline is None or time.monotonic() < deadline:
+            return False
+
+        if stats is not None:
+            stats["partial"] = True
+
+        return True
+
+    @staticmethod
+    def is_given_up(matcher: Matcher, stats: Optional[Dict] = None) -> bool:
+        if not matcher.is_partial:
+            return False
+
+        if stats is not None:
+            stats["partial"] = True
 
-        # Delete empty lines
-        lines = [line for line in lines if len(line.strip()) > 0]
-        full_doc = "\n".join(lines)
-        sz_lines = len(lines)
+        return True
 
-        # Attempt to parse title
-        title = path
+    @classmethod
+    async def iter_matches(
+        cls,
+        root: str,
+        keyword: str,
+        n_threads=128,
+        file_extensions: Optional[List[str]] = None,
+        backend: str = "thread",
+        limit: Optional[int] = None,
+        mode: str = "exact",
+        deadline: Optional[float] = None,
+        stats: Optional[Dict] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Yields the matches of every batch as soon as it is done. Batches are
+        not sorted against each other.
+
+        backend: "thread" matches in the default executor, "process" in the
+        ProcessBackend workers which are not bound by the GIL
+        limit: stop scanning once this many exact matches were found, as
+        nothing found afterwards can rank above them
+        mode: one of Matcher's MODES, "exact", "query", "regex" or "bm25"
+        deadline: time.monotonic() after which no new batch is started
+        stats: filled with "partial": True when the deadline, or the matcher's
+        own budget, cut the scan short
+        """
+        # Bad queries fail before any work is done
+        matcher = Matcher.create(keyword, mode, limit)
+        ProcessBackend.ensure_backend(backend)
+        source = cls.get_source(root, file_extensions)
+
+        # Picks up added, changed and deleted files since the last scan
+        try:
+            await asyncio.wait_for(
+                source.refresh_shared(n_threads),
+                None if deadline is None else max(deadline - time.monotonic(), 0.0),
+            )
+        except asyncio.TimeoutError:
+            # The refresh goes on in the background, see refresh_shared
+            if stats is not None:
+                stats["partial"] = True
+
+            return
+
+        # A shared corpus swapped by a concurrent refresh must not show
+        # through halfway, the whole search reads one generation
+        source = source.get_view()
 
-        # Jekyll Markdown?
-        if path.endswith(".markdown") or path.endswith(".md"):
-            has_dashes_once = False
+        # Scores and the best limit chunks only hold over the whole index
+        if source.is_shared or matcher.needs_whole_index:
+            backend = "thread"
 
-            for ind in range(len(lines)):
-                line = lines[ind]
+        n_exact = 0
 
-                if line.startswith("---"):
-                    if has_dashes_once:
-                        break
+        if backend == "process":
+            async for found, is_partial in ProcessBackend.iter_find(
+                cls.get_source_key(root, file_extensions), source, keyword, limit, mode
+            ):
+                Metrics.inc("shards_scanned_total")
+                matcher.is_partial |= is_partial
+                batch = [match for matches in found.values() for match in matches]
+                n_exact += sum(1 for match in batch if match["priority"] == 0)
 
-                    has_dashes_once = True
+                yield batch
 
-                # Extract page title if found
-                if line.startswith("title: "):
-                    title = line.split("title: ")[-1]
+                if cls.is_past(deadline, stats):
                     break
-        elif path.endswith(".html"):
-            # Let's extract <head> content
-            start_index = full_doc.find("<head>") + len("<head>")
-            end_index = full_doc.find("</head>")
+        else:
+            async for batch in cls.iter_indexed_matches(
+                source, matcher, n_threads, deadline, stats
+            ):
+                n_exact += sum(1 for match in batch if match["priority"] == 0)
 
-            # Extract lines belonging to the head
-            head_content = full_doc[start_index:end_index].strip()
+                yield batch
 
-            # Now look for title
-            start_index = full_doc.find("<title>") + len("<title>")
-            end_index = full_doc.find("</title>")
+                if limit is not None and n_exact >= limit:
+                    return
 
-            # If there is indeed a title set, grab it!
-            if end_index != -1:
-                title = full_doc[start_index:end_index].strip()
+        large_paths = source.get_large_paths()
 
-        chunks = []
+        # Not left out silently, the source is reported as partial
+        if len(large_paths) > 0 and not matcher.covers_large_files:
+            if stats is not None:
+                stats["partial"] = True
 
-        # Group lines into chunks
-        for i in range(0, sz_lines, context_length):
-            if i >= sz_lines:
+            large_paths = []
+
+        # Large files one at a time, each is searched as a whole
+        for path in large_paths:
+            if limit is not None and n_exact >= limit:
                 break
-            chunks.append("\n".join(lines[i : min(sz_lines, i + context_length)]))
-
-        lower_chunks = [chunk.lower() for chunk in chunks]
-        lower_keyword = keyword.lower()
-        idxes = [i for i in range(len(chunks))]
-
-        for idx, lower, raw in zip(idxes, lower_chunks, chunks):
-            # Case sensitive
-            if keyword in raw:
-                ret.append(
-                    {
-                        "type": "exact",
-                        "title": title,
-                        "keyword": keyword,
-                        "input_keyword": keyword,
-                        "chunk": raw.split("\n"),
-                        "priority": 0,
-                        "path": path or "anonymous",
-                    }
-                )
-            # Case insensitive
-            elif lower_keyword in lower:
-                ret.append(
-                    {
-                        "type": "bad_case",
-                        "title": title,
-                        "keyword": lower_keyword,
-                        "input_keyword": keyword,
-                        "chunk": raw.split("\n"),
-                        "priority": 1,
-                        "path": path or "anonymous",
-                    }
+
+            if cls.is_past(deadline, stats) or cls.is_given_up(matcher, stats):
+                break
+
+            with Metrics.time("match_large"):
+                batch = await Util.sync_to_async(
+                    functools.partial(cls.match_mapped, source, matcher, path)
                 )
-            # Disable subset search since it is NOT reliable
-            # else:
-            #     space_only = str.maketrans("", "", string.punctuation)
-            #     broken_keys = [
-            #         key.lower() for key in keyword.translate(space_only).split()
-            #     ]
-
-            #     for key in broken_keys:
-            #         if key in lower:
-            #             ret.append(
-            #                 {
-            #                     "type": "subset",
-            #                     "title": title,
-            #                     "keyword": key,
-            #                     "input_keyword": keyword,
-            #                     "chunk": raw.split("\n"),
-            #                     "priority": 1,
-            #                     "path": path or "anonymous",
-            #                 }
-            #             )
 
-        return ret
+            Metrics.inc("files_scanned_total")
+            n_exact += sum(1 for match in batch if match["priority"] == 0)
+
+            yield batch
+
+        cls.is_given_up(matcher, stats)
+
+    @staticmethod
+    def match_mapped(source: SourceIndex, matcher: Matcher, path: str) -> List[Dict]:
+        try:
+            with source.open_mapped(path) as file:
+                return matcher.match_mapped(file)
+        except (OSError, ValueError) as e:
+            # Vanished or truncated since the last scan
+            Util.warn(f"cannot map {path}: {Util.get_proper_msg(e)}")
+            return []
+
+    @staticmethod
+    def get_chunk_candidates(chunk_idxs: Set[int], document: Document) -> Set[int]:
+        # A corpus scan may have seen another version of the document
+        n_chunks = len(document.chunks)
+
+        if all(idx < n_chunks for idx in chunk_idxs):
+            return chunk_idxs
+
+        return {idx for idx in chunk_idxs if idx < n_chunks}
 
     @classmethod
-    async def find_in_files(
+    async def iter_indexed_matches(
         cls,
-        root: str,
-        keyword: str,
-        n_threads=128,
-        file_extensions: Optional[List[str]] = None,
-    ) -> List[Dict]:
-        ret = []
-        file_map = await cls.get_file_paths(root)
+        source: SourceIndex,
+        matcher: Matcher,
+        n_threads: int,
+        deadline: Optional[float] = None,
+        stats: Optional[Dict] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Matches of the ingested documents batch by batch, in walk order
+        """
+        # List of relative paths
+        file_list = source.get_paths()
 
-        # Filter by file extension
-        if file_extensions is not None:
-            file_extensions = set(file_extensions)
-            file_map = {
-                k: v
-                for k, v in file_map.items()
-                if ("." in v) and (v.split(".")[-1] in file_extensions)
-            }
+        # Shortlist chunks by trigrams, keywords shorter than that fall back to a scan
+        with Metrics.time("candidates"):
+            candidates = matcher.get_candidates(source.index)
 
-        # List of relative paths
-        file_list = list(file_map.keys())
+            if candidates is None and matcher.scans_corpus:
+                candidates = matcher.scan_corpus(await source.get_corpus())
+
+        if candidates is not None:
+            file_list = [path for path in file_list if path in candidates]
+
+        # Versions the candidates were picked from, a refresh may replace
+        # them while this search awaits
+        keys = source.get_keys(file_list)
         sz_list = len(file_list)
 
         for i in range(0, sz_list, n_threads):
             if i >= sz_list:
                 break
 
+            if cls.is_past(deadline, stats) or cls.is_given_up(matcher, stats):
+                break
+
             # Now 'chunk' contains a subset of the original list with at most 128 elements
             chunk = file_list[i : min(i + n_threads, sz_list)]
 
-            files = await cls.read_all(
-                [file_map[relative_path] for relative_path in chunk]
-            )
+            with Metrics.time("load"):
+                documents = await source.get_documents(chunk, keys[i : i + len(chunk)])
 
             coroutines = [
                 Util.sync_to_async(
                     functools.partial(
-                        cls.find_in_file,
-                        keyword=keyword,
-                        lines=lines,
-                        context_length=4,
-                        path=path,
+                        matcher.match_document,
+                        doc=document,
+                        candidates=(
+                            None
+                            if candidates is None
+                            else cls.get_chunk_candidates(candidates[path], document)
+                        ),
                     )
                 )
-                for path, lines in zip(chunk, list(files.values()))
+                for path, document in zip(chunk, documents)
+                # Gone since the candidates were picked
+                if document is not None
             ]
+            with Metrics.time("match"):
+                chunk_res: List[List[Dict]] = await asyncio.gather(*coroutines)
+
+            Metrics.inc("files_scanned_total", len(chunk))
 
-            chunk_res: List[List[Dict]] = await asyncio.gather(*coroutines)
+            yield [match for chk in chunk_res for match in chk]
 
-            for chk in chunk_res:
-                ret += chk
+    @classmethod
+    async def find_in_files(
+        cls,
+        root: str,
+        keyword: str,
+        n_threads=128,
+        file_extensions: Optional[List[str]] = None,
+        backend: str = "thread",
+        limit: Optional[int] = None,
+        mode: str = "exact",
+        deadline: Optional[float] = None,
+        stats: Optional[Dict] = None,
+    ) -> List[Dict]:
+        """
+        limit: only the first limit matches are guaranteed to be complete, the
+        scan stops early once they are all exact matches
+        deadline, stats: see iter_matches
+        """
+        ret = []
+
+        async for batch in cls.iter_matches(
+            root,
+            keyword,
+            n_threads,
+            file_extensions,
+            backend,
+            limit,
+            mode,
+            deadline,
+            stats,
+        ):
+            ret += batch
+
+        with Metrics.time("sort"):
+            if backend == "process":
+                # Shards finish in any order, restore walk order
+                source = cls.get_source(root, file_extensions)
+                order = {
+                    path: i
+                    for i, path in enumerate(
+                        source.get_paths() + source.get_large_paths()
+                    )
+                }
+                ret.sort(key=lambda entry: order.get(entry["path"], 0))
 
-        ret.sort(key=lambda entry: entry["priority"])
+            ret.sort(key=cls.get_rank)
 
         return ret
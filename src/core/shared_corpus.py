@@ -0,0 +1,736 @@
+import fcntl
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import time
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy
+
+from src.core.document import Document
+from src.core.mapped_file import MappedFile
+from src.core.source_index import SourceIndex
+from src.core.term_dictionary import TermDictionary
+from src.core.term_index import TermIndex
+from src.core.trigram_index import TrigramIndex
+from src.utils.util import Util
+
+
+class SharedChunks(Sequence):
+    """
+    Chunks of one document, decoded from a SharedCorpus section on access
+    """
+
+    def __init__(
+        self, data: mmap.mmap, base: int, starts: numpy.ndarray, first: int, n: int
+    ):
+        self.data = data
+        self.base = base
+        self.starts = starts
+        self.first = first
+        self.n = n
+
+        # Matching a chunk and making its match read it twice in a row
+        self.last: Tuple[int, Optional[str]] = (-1, None)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, idx: int) -> str:
+        if idx < 0:
+            idx += self.n
+
+        if not 0 <= idx < self.n:
+            raise IndexError(idx)
+
+        if self.last[0] == idx:
+            return self.last[1]
+
+        i = self.first + idx
+        start = self.base + int(self.starts[i])
+
+        # Every chunk is followed by a separator
+        ret = self.data[start : self.base + int(self.starts[i + 1]) - 1].decode()
+        self.last = (idx, ret)
+
+        return ret
+
+
+class SharedDocument:
+    """
+    What matchers need from a Document, read from a SharedCorpus
+    """
+
+    def __init__(self, corpus: "SharedCorpus", doc_no: int):
+        first = int(corpus.doc_starts[doc_no])
+        n = int(corpus.doc_starts[doc_no + 1]) - first
+
+        self.path = corpus.paths[doc_no]
+        self.title = corpus.titles[doc_no]
+        self.chunks = SharedChunks(
+            corpus.data, corpus.offsets["text"], corpus.text_starts, first, n
+        )
+        self.folded_chunks = SharedChunks(
+            corpus.data, corpus.offsets["folded"], corpus.folded_starts, first, n
+        )
+        self.line_nos = corpus.line_nos
+        self.chunk_lines = corpus.chunk_lines[first : first + n + 1]
+
+    def get_chunk_start(self, chunk_idx: int) -> int:
+        return int(self.line_nos[self.chunk_lines[chunk_idx]])
+
+    def get_chunk_line_nos(self, chunk_idx: int) -> List[int]:
+        start, end = self.chunk_lines[chunk_idx], self.chunk_lines[chunk_idx + 1]
+        return self.line_nos[start:end].tolist()
+
+    def get_chunk_lines(self, chunk_idx: int) -> List[str]:
+        return self.chunks[chunk_idx].split("\n")
+
+
+class SharedTermDictionary(TermDictionary):
+    """
+    What find_similar needs from a TermDictionary, read from a SharedCorpus.
+    Term ids are term numbers of the corpus.
+    """
+
+    def __init__(self, corpus: "SharedCorpus"):
+        self.corpus = corpus
+        self.terms = corpus.term_list
+        self.gram_counts = corpus.dict_gram_counts
+
+    def get_gram_posting(self, gram: str) -> numpy.ndarray:
+        corpus = self.corpus
+        key = numpy.uint64(corpus.get_gram_key(gram))
+        i = int(numpy.searchsorted(corpus.dict_gram_keys, key))
+
+        if i == len(corpus.dict_gram_keys) or corpus.dict_gram_keys[i] != key:
+            return corpus.dict_gram_terms[:0]
+
+        start, end = corpus.dict_gram_starts[i], corpus.dict_gram_starts[i + 1]
+        return corpus.dict_gram_terms[start:end]
+
+
+class SharedTerms(TermIndex):
+    """
+    What BM25 and FuzzyMatcher need from a TermIndex, read from a
+    SharedCorpus. Chunk ids are chunk numbers of the corpus.
+    """
+
+    def __init__(self, corpus: "SharedCorpus"):
+        self.corpus = corpus
+        self.term_nos = {term: i for i, term in enumerate(corpus.term_list)}
+        self.chunk_lengths = corpus.chunk_lengths
+        self.n_chunks = len(corpus.chunk_lengths)
+        self.total_length = corpus.total_length
+        self.dictionary = SharedTermDictionary(corpus)
+
+    def get_posting(self, term: str) -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]:
+        term_no = self.term_nos.get(term)
+
+        if term_no is None:
+            return None
+
+        start = self.corpus.term_starts[term_no]
+        end = self.corpus.term_starts[term_no + 1]
+
+        return self.corpus.term_chunks[start:end], self.corpus.term_tfs[start:end]
+
+
+class SharedCorpus:
+    """
+    The documents and trigram index of one source generation in a single
+    read-only file, meant for a tmpfs such as /dev/shm: one builder process
+    writes it, every HTTP worker maps it, and the page cache keeps one copy
+    for all of them. A new generation is written aside and renamed over the
+    old one, so a worker either maps the old file or the new one; searches
+    already running keep the mapping they started with.
+
+    An attached corpus offers the read side of SourceIndex (and of
+    TrigramIndex, TermIndex and CorpusBuffer), so SearchSys searches it
+    unchanged, bm25 and fuzzy searches included.
+    """
+
+    magic = b"NDSCORP\0"
+    version = 4
+
+    # magic, version, padding, serial, length of the pickled table of contents
+    header = struct.Struct("<8sIIQQ")
+
+    is_shared = True
+
+    # Held by the builder for as long as it runs, see try_lead
+    lock_file = None
+
+    sections = [
+        ("text", numpy.uint8),
+        ("folded", numpy.uint8),
+        ("text_starts", numpy.int64),
+        ("folded_starts", numpy.int64),
+        ("line_nos", numpy.int32),
+        ("chunk_lines", numpy.int64),
+        ("chunk_docs", numpy.int32),
+        ("doc_starts", numpy.int64),
+        ("gram_keys", numpy.uint64),
+        ("gram_starts", numpy.int64),
+        ("gram_chunks", numpy.int32),
+        ("chunk_lengths", numpy.float32),
+        ("term_starts", numpy.int64),
+        ("term_chunks", numpy.int32),
+        ("term_tfs", numpy.float32),
+        ("dict_gram_keys", numpy.uint64),
+        ("dict_gram_starts", numpy.int64),
+        ("dict_gram_terms", numpy.int32),
+        ("dict_gram_counts", numpy.float32),
+    ]
+
+    # Code points of the chunks turned into trigrams at a time when writing
+    gram_batch_size = 1 << 22
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, serial, toc_length = self.header.unpack_from(self.data)
+
+        if magic != self.magic or version != self.version:
+            raise Exception(f"{path} is not a version {self.version} shared corpus")
+
+        toc = pickle.loads(self.data[self.header.size : self.header.size + toc_length])
+
+        # Unique per publication, stands for the generation
+        self.generation = serial
+        self.root: str = toc["root"]
+        self.context_length: int = toc["context_length"]
+        self.paths: List[str] = toc["paths"]
+        self.titles: List[str] = toc["titles"]
+        self.large: Dict[str, Tuple] = toc["large"]
+        self.term_list: List[str] = toc["terms"]
+        self.total_length: int = toc["total_length"]
+        self.doc_nos = {path: i for i, path in enumerate(self.paths)}
+
+        # Section name -> offset in data
+        self.offsets: Dict[str, int] = {}
+
+        for name, dtype in self.sections:
+            offset, count = toc["sections"][name]
+            self.offsets[name] = offset
+            setattr(
+                self,
+                name,
+                numpy.frombuffer(self.data, dtype=dtype, count=count, offset=offset),
+            )
+
+        self.index = self
+
+    @staticmethod
+    def get_path(shared_dir: str, key: Tuple) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(shared_dir, f"{name}.corpus")
+
+    @classmethod
+    def try_lead(cls, shared_dir: str) -> bool:
+        """
+        Whether this process is the one to build and publish the corpora. The
+        lock is released by the OS when the process exits, and the next
+        process to start takes over.
+        """
+        if cls.lock_file is not None:
+            return True
+
+        os.makedirs(shared_dir, exist_ok=True)
+        lock_file = open(os.path.join(shared_dir, "builder.lock"), "w")
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        cls.lock_file = lock_file
+        return True
+
+    @staticmethod
+    def pack_grams(code_points: numpy.ndarray) -> numpy.ndarray:
+        # Code points fit in 21 bits, three of them in a uint64
+        c = code_points.astype(numpy.uint64)
+        return (c[:-2] << numpy.uint64(42)) | (c[1:-1] << numpy.uint64(21)) | c[2:]
+
+    @classmethod
+    def get_gram_key(cls, gram: str) -> int:
+        return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+    @classmethod
+    def build_grams(
+        cls, folded_chunks: List[str]
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        (sorted trigram keys, start of each key's posting, chunk numbers) of
+        the folded chunks, same trigrams as TrigramIndex.get_trigrams
+        """
+        all_keys = []
+        all_chunks = []
+        i = 0
+
+        while i < len(folded_chunks):
+            # A batch of chunks of about gram_batch_size code points
+            batch = []
+            n_code_points = 0
+
+            while i < len(folded_chunks) and (
+                len(batch) == 0 or n_code_points < cls.gram_batch_size
+            ):
+                batch.append(folded_chunks[i])
+                n_code_points += len(folded_chunks[i]) + 1
+                i += 1
+
+            first_chunk = i - len(batch)
+            code_points = numpy.frombuffer(
+                ("\0".join(batch) + "\0").encode("utf-32-le"), dtype=numpy.uint32
+            )
+            chunk_nos = numpy.repeat(
+                numpy.arange(first_chunk, i, dtype=numpy.int32),
+                [len(chunk) + 1 for chunk in batch],
+            )
+
+            keys = cls.pack_grams(code_points)
+            chunk_nos = chunk_nos[:-2]
+
+            # No trigram spans two chunks
+            is_valid = (code_points[:-2] != 0) & (code_points[1:-1] != 0)
+            is_valid &= code_points[2:] != 0
+            keys, chunk_nos = keys[is_valid], chunk_nos[is_valid]
+
+            order = numpy.lexsort((chunk_nos, keys))
+            keys, chunk_nos = keys[order], chunk_nos[order]
+            is_new = numpy.ones(len(keys), dtype=bool)
+            is_new[1:] = (keys[1:] != keys[:-1]) | (chunk_nos[1:] != chunk_nos[:-1])
+
+            all_keys.append(keys[is_new])
+            all_chunks.append(chunk_nos[is_new])
+
+        keys = numpy.concatenate(all_keys) if all_keys else numpy.zeros(0, numpy.uint64)
+        chunk_nos = (
+            numpy.concatenate(all_chunks) if all_chunks else numpy.zeros(0, numpy.int32)
+        )
+
+        # Batches are in chunk order, a stable sort keeps postings sorted
+        order = numpy.argsort(keys, kind="stable")
+        keys, chunk_nos = keys[order], chunk_nos[order]
+        gram_keys, gram_starts = numpy.unique(keys, return_index=True)
+
+        return (
+            gram_keys,
+            numpy.append(gram_starts, len(keys)).astype(numpy.int64),
+            chunk_nos,
+        )
+
+    @staticmethod
+    def build_terms(
+        folded_chunks: List[str],
+    ) -> Tuple[List[str], numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        (terms, chunk lengths, start of each term's posting, chunk numbers,
+        term frequencies) of the folded chunks, as in TermIndex
+        """
+        term_nos: Dict[str, int] = {}
+        chunk_lengths = numpy.zeros(len(folded_chunks), dtype=numpy.float32)
+        all_terms, all_chunks, all_tfs = array("i"), array("i"), array("i")
+
+        for chunk_no, chunk in enumerate(folded_chunks):
+            tokens = TermIndex.tokenize(chunk)
+            chunk_lengths[chunk_no] = len(tokens)
+
+            for term, tf in Counter(tokens).items():
+                all_terms.append(term_nos.setdefault(term, len(term_nos)))
+                all_chunks.append(chunk_no)
+                all_tfs.append(tf)
+
+        term_nos_of = numpy.frombuffer(all_terms, dtype=numpy.int32)
+
+        # Chunks come in order, a stable sort keeps postings sorted
+        order = numpy.argsort(term_nos_of, kind="stable")
+        term_starts = numpy.zeros(len(term_nos) + 1, dtype=numpy.int64)
+        numpy.cumsum(
+            numpy.bincount(term_nos_of, minlength=len(term_nos)), out=term_starts[1:]
+        )
+
+        return (
+            list(term_nos),
+            chunk_lengths,
+            term_starts,
+            numpy.frombuffer(all_chunks, dtype=numpy.int32)[order],
+            numpy.frombuffer(all_tfs, dtype=numpy.int32)[order],
+        )
+
+    @classmethod
+    def build_term_grams(
+        cls, terms: List[str]
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        (sorted trigram keys, start of each key's posting, term numbers, size
+        of every term's trigram set) of terms, as in TermDictionary
+        """
+        keys = []
+        term_nos = array("i")
+        gram_counts = numpy.zeros(len(terms), dtype=numpy.float32)
+
+        for term_no, term in enumerate(terms):
+            grams = TermDictionary.get_grams(term)
+            gram_counts[term_no] = len(grams)
+            keys.extend(cls.get_gram_key(gram) for gram in grams)
+            term_nos.extend([term_no] * len(grams))
+
+        keys = numpy.array(keys, dtype=numpy.uint64)
+        term_nos = numpy.frombuffer(term_nos, dtype=numpy.int32)
+
+        # Terms come in order, a stable sort keeps postings sorted
+        order = numpy.argsort(keys, kind="stable")
+        keys, term_nos = keys[order], term_nos[order]
+        gram_keys, gram_starts = numpy.unique(keys, return_index=True)
+
+        return (
+            gram_keys,
+            numpy.append(gram_starts, len(keys)).astype(numpy.int64),
+            term_nos,
+            gram_counts,
+        )
+
+    @staticmethod
+    def get_chunk_lines(documents: List[Document]) -> numpy.ndarray:
+        """
+        Index in line_nos of the first line of every chunk, then their count
+        """
+        ret = []
+        first = 0
+
+        for document in documents:
+            ret.extend(first + start for start in document.chunk_starts)
+            first += len(document.lines)
+
+        ret.append(first)
+        return numpy.array(ret, dtype=numpy.int64)
+
+    @staticmethod
+    def join_chunks(chunks: List[str]) -> Tuple[bytes, numpy.ndarray]:
+        encoded = [chunk.encode() for chunk in chunks]
+        starts = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum(
+            numpy.array([len(chunk) + 1 for chunk in encoded], dtype=numpy.int64),
+            out=starts[1:],
+        )
+
+        return b"".join(chunk + b"\0" for chunk in encoded), starts
+
+    @classmethod
+    def write(
+        cls,
+        shared_dir: str,
+        key: Tuple,
+        context_length: int,
+        paths: List[str],
+        documents: List[Document],
+        large: Dict[str, Tuple],
+    ) -> str:
+        """
+        Publishes one generation of the source of key, returns its path
+        """
+        chunks = [chunk for document in documents for chunk in document.chunks]
+        folded_chunks = [
+            chunk for document in documents for chunk in document.folded_chunks
+        ]
+        text, text_starts = cls.join_chunks(chunks)
+        folded, folded_starts = cls.join_chunks(folded_chunks)
+        del chunks
+
+        n_chunks = numpy.array(
+            [len(document.chunks) for document in documents], dtype=numpy.int64
+        )
+        doc_starts = numpy.zeros(len(documents) + 1, dtype=numpy.int64)
+        numpy.cumsum(n_chunks, out=doc_starts[1:])
+
+        gram_keys, gram_starts, gram_chunks = cls.build_grams(folded_chunks)
+        terms, chunk_lengths, term_starts, term_chunks, term_tfs = cls.build_terms(
+            folded_chunks
+        )
+        del folded_chunks
+
+        dict_gram_keys, dict_gram_starts, dict_gram_terms, dict_gram_counts = (
+            cls.build_term_grams(terms)
+        )
+
+        arrays = {
+            "text": numpy.frombuffer(text, dtype=numpy.uint8),
+            "folded": numpy.frombuffer(folded, dtype=numpy.uint8),
+            "text_starts": text_starts,
+            "folded_starts": folded_starts,
+            "line_nos": numpy.array(
+                [line_no for document in documents for line_no in document.line_nos],
+                dtype=numpy.int32,
+            ),
+            "chunk_lines": cls.get_chunk_lines(documents),
+            "chunk_docs": numpy.repeat(
+                numpy.arange(len(documents), dtype=numpy.int32), n_chunks
+            ),
+            "doc_starts": doc_starts,
+            "gram_keys": gram_keys,
+            "gram_starts": gram_starts,
+            "gram_chunks": gram_chunks,
+            "chunk_lengths": chunk_lengths,
+            "term_starts": term_starts,
+            "term_chunks": term_chunks,
+            "term_tfs": term_tfs,
+            "dict_gram_keys": dict_gram_keys,
+            "dict_gram_starts": dict_gram_starts,
+            "dict_gram_terms": dict_gram_terms,
+            "dict_gram_counts": dict_gram_counts,
+        }
+        toc = {
+            "root": key[0],
+            "context_length": context_length,
+            "paths": paths,
+            "titles": [document.title for document in documents],
+            "large": large,
+            "terms": terms,
+            "total_length": int(chunk_lengths.sum()),
+            "sections": {},
+        }
+
+        # Sections start 8-byte aligned after the table of contents, whose
+        # size depends on their offsets: lay them out from a generous guess
+        toc_length = len(pickle.dumps(toc, protocol=pickle.HIGHEST_PROTOCOL)) + 4096
+        offset = cls.header.size + toc_length
+
+        for name, dtype in cls.sections:
+            array = arrays[name].astype(dtype, copy=False)
+            arrays[name] = array
+            offset += -offset % 8
+            toc["sections"][name] = (offset, len(array))
+            offset += array.nbytes
+
+        toc_data = pickle.dumps(toc, protocol=pickle.HIGHEST_PROTOCOL)
+
+        if len(toc_data) > toc_length:
+            raise Exception(f"table of contents of {key[0]} outgrew its space")
+
+        os.makedirs(shared_dir, exist_ok=True)
+        path = cls.get_path(shared_dir, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "wb") as file:
+            file.write(
+                cls.header.pack(
+                    cls.magic, cls.version, 0, time.time_ns(), len(toc_data)
+                )
+            )
+            file.write(toc_data)
+
+            for name, _ in cls.sections:
+                file.seek(toc["sections"][name][0])
+                file.write(arrays[name].tobytes())
+
+        # Workers see either the old generation or the new one
+        os.replace(tmp_path, path)
+
+        return path
+
+    def get_paths(self) -> List[str]:
+        return self.paths
+
+    def get_large_paths(self) -> List[str]:
+        return list(self.large)
+
+    def open_mapped(self, path: str) -> MappedFile:
+        return MappedFile(path, self.root + path, self.large[path], self.context_length)
+
+    def get_keys(self, paths: List[str]) -> List[Optional[int]]:
+        # A mapped generation never changes, document numbers will do
+        return [self.doc_nos.get(path) for path in paths]
+
+    async def get_documents(
+        self, paths: List[str], keys: Optional[List[Optional[int]]] = None
+    ) -> List[Optional[SharedDocument]]:
+        if keys is None:
+            keys = self.get_keys(paths)
+
+        return [
+            None if doc_no is None else SharedDocument(self, doc_no) for doc_no in keys
+        ]
+
+    async def get_corpus(self) -> "SharedCorpus":
+        return self
+
+    def get_posting(self, gram: str) -> numpy.ndarray:
+        key = numpy.uint64(self.get_gram_key(gram))
+        i = int(numpy.searchsorted(self.gram_keys, key))
+
+        if i == len(self.gram_keys) or self.gram_keys[i] != key:
+            return self.gram_chunks[:0]
+
+        return self.gram_chunks[self.gram_starts[i] : self.gram_starts[i + 1]]
+
+    def lookup_ids(self, keyword: str) -> Optional[Set[int]]:
+        """
+        Same as TrigramIndex.lookup_ids, chunk ids are chunk numbers here
+        """
+        grams = TrigramIndex.get_trigrams(keyword)
+
+        if len(grams) == 0:
+            return None
+
+        postings = sorted((self.get_posting(gram) for gram in grams), key=len)
+        chunk_ids = postings[0]
+
+        for posting in postings[1:]:
+            if len(chunk_ids) == 0:
+                break
+            chunk_ids = numpy.intersect1d(chunk_ids, posting, assume_unique=True)
+
+        return set(chunk_ids.tolist())
+
+    def get_chunk_ref(self, chunk_id: int) -> Tuple[str, int]:
+        doc_no = int(self.chunk_docs[chunk_id])
+        return self.paths[doc_no], chunk_id - int(self.doc_starts[doc_no])
+
+    def group_ids(self, chunk_ids: Set[int]) -> Dict[str, Set[int]]:
+        ret: Dict[str, Set[int]] = {}
+        chunk_ids = numpy.fromiter(chunk_ids, dtype=numpy.int64, count=len(chunk_ids))
+        doc_nos = self.chunk_docs[chunk_ids]
+        chunk_idxs = chunk_ids - self.doc_starts[doc_nos]
+
+        for doc_no, chunk_idx in zip(doc_nos.tolist(), chunk_idxs.tolist()):
+            ret.setdefault(self.paths[doc_no], set()).add(chunk_idx)
+
+        return ret
+
+    def lookup(self, keyword: str) -> Optional[Dict[str, Set[int]]]:
+        chunk_ids = self.lookup_ids(keyword)
+
+        return None if chunk_ids is None else self.group_ids(chunk_ids)
+
+    @functools.cached_property
+    def terms(self) -> SharedTerms:
+        # Built on the first bm25 or fuzzy search of this generation
+        return SharedTerms(self)
+
+    def find(self, folded_keyword: str) -> Dict[str, Set[int]]:
+        """
+        Same as CorpusBuffer.find, over the folded section
+        """
+        ret: Dict[str, Set[int]] = {}
+        needle = folded_keyword.encode()
+        starts = self.folded_starts
+        n_chunks = len(starts) - 1
+
+        if n_chunks == 0 or len(needle) == 0:
+            return ret
+
+        base = self.offsets["folded"]
+        end = base + int(starts[-1])
+        pos = self.data.find(needle, base, end)
+
+        while pos != -1:
+            chunk_no = int(numpy.searchsorted(starts, pos - base, side="right")) - 1
+            doc_no = int(self.chunk_docs[chunk_no])
+            ret.setdefault(self.paths[doc_no], set()).add(
+                chunk_no - int(self.doc_starts[doc_no])
+            )
+
+            # The rest of this chunk cannot add anything
+            if chunk_no + 1 >= n_chunks:
+                break
+
+            pos = self.data.find(needle, base + int(starts[chunk_no + 1]), end)
+
+        return ret
+
+
+class SharedSource(SourceIndex):
+    """
+    A source as seen by an HTTP worker that does not build it: refreshing
+    maps the latest generation the builder published, and searches run on
+    the SharedCorpus they started with, see get_view
+    """
+
+    shared_dir: str = None
+    key: Tuple = None
+    view: Optional[SharedCorpus] = None
+
+    # (inode, mtime_ns) of the mapped file
+    view_stat: Optional[Tuple[int, int]] = None
+
+    is_shared = True
+
+    def __init__(
+        self,
+        shared_dir: str,
+        root: str,
+        file_extensions: Optional[List[str]] = None,
+        context_length: int = 4,
+    ):
+        super().__init__(root, file_extensions, context_length)
+        self.shared_dir = shared_dir
+        self.key = (root, None if file_extensions is None else tuple(file_extensions))
+
+    async def refresh(
+        self, n_threads: int = 128, force: bool = False, progress: Optional[Dict] = None
+    ) -> bool:
+        """
+        Maps the latest published generation, returns True if it is new
+        """
+        path = SharedCorpus.get_path(self.shared_dir, self.key)
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise Exception(f"{self.key[0]} is not published in {self.shared_dir} yet")
+
+        if self.view is None or self.view_stat != (st.st_ino, st.st_mtime_ns):
+            view = await Util.sync_to_async(lambda: SharedCorpus(path))
+
+            self.view = view
+            self.view_stat = (st.st_ino, st.st_mtime_ns)
+            self.generation = view.generation
+            self.index = view
+
+            if progress is not None:
+                progress.update({"n_files": len(view.paths), "n_read": len(view.paths)})
+
+            return True
+
+        return False
+
+    def get_view(self) -> SharedCorpus:
+        if self.view is None:
+            raise Exception(f"{self.key[0]} is not published in {self.shared_dir} yet")
+
+        return self.view
+
+    def get_paths(self) -> List[str]:
+        return self.get_view().get_paths()
+
+    def get_large_paths(self) -> List[str]:
+        return self.get_view().get_large_paths()
+
+    def open_mapped(self, path: str) -> MappedFile:
+        return self.get_view().open_mapped(path)
+
+    def get_keys(self, paths: List[str]) -> List[Optional[int]]:
+        return self.get_view().get_keys(paths)
+
+    async def get_documents(
+        self, paths: List[str], keys: Optional[List[Optional[int]]] = None
+    ) -> List[Optional[SharedDocument]]:
+        return await self.get_view().get_documents(paths, keys)
+
+    async def get_corpus(self) -> SharedCorpus:
+        return self.get_view()
+
+    def watch(self, interval: float = 2.0):
+        # The builder watches the files
+        pass
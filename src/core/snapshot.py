@@ -0,0 +1,137 @@
+import hashlib
+import os
+import pickle
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
+from src.core.corpus_buffer import CorpusBlocks
+from src.core.document_store import DocumentStore
+from src.core.source_index import SourceIndex
+from src.utils.util import Util
+
+
+class Snapshot:
+    """
+    Saves a SourceIndex (tracker stats, trigram and term indexes, documents
+    still in the DocumentStore) to disk so that a restarted server starts
+    warm. Files are a fixed header (magic, format version, CRC32 and length
+    of the payload) followed by a pickled payload, written atomically. A
+    loaded snapshot is only a starting point: the next refresh compares it
+    against the files' mtimes like any other scan.
+    """
+
+    magic = b"NDSSNAP\0"
+    version = 3
+    header = struct.Struct("<8sIIQ")
+
+    @staticmethod
+    def get_path(snapshot_dir: str, key: Tuple) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(snapshot_dir, f"{name}.snapshot")
+
+    @classmethod
+    def dump(cls, key: Tuple, source: SourceIndex) -> bytes:
+        """
+        Header and payload of source. No refresh may interleave with it, see
+        SourceIndex.run_exclusive
+        """
+        documents = {}
+
+        for rel_path, store_key in source.indexed.items():
+            document = DocumentStore.peek(store_key)
+
+            # Evicted documents are re-read on demand, their key stays valid
+            if document is not None:
+                documents[rel_path] = document
+
+        payload = pickle.dumps(
+            {
+                "key": key,
+                "context_length": source.context_length,
+                "stats": source.tracker.stats,
+                "indexed": source.indexed,
+                "large": source.large,
+                "generation": source.generation,
+                "index": source.index,
+                "documents": documents,
+            },
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+        return (
+            cls.header.pack(cls.magic, cls.version, zlib.crc32(payload), len(payload))
+            + payload
+        )
+
+    @classmethod
+    def write(cls, snapshot_dir: str, key: Tuple, data: bytes):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        path = cls.get_path(snapshot_dir, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+
+        # Readers see either the old snapshot or the new one, never half of it
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read(cls, snapshot_dir: str, key: Tuple) -> Optional[Dict]:
+        """
+        Validated state of the snapshot of key, None if there is no usable one
+        """
+        path = cls.get_path(snapshot_dir, key)
+
+        if not os.path.isfile(path) or os.path.getsize(path) < cls.header.size:
+            return None
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, version, checksum, length = cls.header.unpack_from(data)
+
+        if magic != cls.magic or version != cls.version:
+            Util.warn(f"ignoring {path}: not a version {cls.version} snapshot")
+            return None
+
+        with memoryview(data)[cls.header.size :] as payload:
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                Util.warn(f"ignoring {path}: checksum mismatch")
+                return None
+
+            ret: Dict = pickle.loads(payload)
+
+        if ret["key"] != key:
+            Util.warn(f"ignoring {path}: built for another source")
+            return None
+
+        return ret
+
+    @staticmethod
+    def apply(state: Dict, source: SourceIndex) -> bool:
+        """
+        Restores source from a state returned by read()
+        """
+        if state["context_length"] != source.context_length:
+            return False
+
+        source.tracker.stats = state["stats"]
+        source.indexed = state["indexed"]
+        source.large = state["large"]
+        source.generation = state["generation"]
+        source.index = state["index"]
+
+        for rel_path, document in state["documents"].items():
+            DocumentStore.put(source.indexed[rel_path], document)
+
+        # Built from the documents on the first scan that needs it
+        source.corpus = CorpusBlocks()
+
+        for rel_path in source.indexed:
+            source.corpus.update(rel_path, source.tracker.stats[rel_path][1])
+
+        # Validated against the files' mtimes on the next scan
+        source.last_scan = 0.0
+
+        return True
@@ -0,0 +1,343 @@
+import asyncio
+import functools
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.change_tracker import ChangeTracker
+from src.core.corpus_buffer import CorpusBlocks, CorpusBuffers
+from src.core.document import Document
+from src.core.document_store import DocumentStore
+from src.core.mapped_file import MappedFile
+from src.core.trigram_index import TrigramIndex
+from src.utils.metrics import Metrics
+from src.utils.util import Util
+
+
+class SourceIndex:
+    """
+    Live view of one source: trigram index and the versions of the documents
+    in it, kept up to date by re-reading only the files the ChangeTracker
+    reports as changed. Document contents live in the DocumentStore.
+    """
+
+    # Minimum seconds between two on-demand rescans of the same source
+    scan_interval = 2.0
+
+    # Files from this size on are not ingested but searched in place, see
+    # MappedFile
+    large_file_bytes = 8 * 1024 * 1024
+
+    context_length: int = 4
+    tracker: ChangeTracker = None
+    index: TrigramIndex = None
+
+    # relative path -> DocumentStore key of the version in the index
+    indexed: Dict[str, Tuple] = None
+
+    # relative path -> DocumentStore-like key of the large files
+    large: Dict[str, Tuple] = None
+
+    # Bumped every time a change is applied
+    generation: int = 0
+
+    # Whether this is a read-only view of a corpus published by another
+    # process, see SharedSource
+    is_shared: bool = False
+
+    # For scans the index cannot shortlist, see get_corpus
+    corpus: CorpusBlocks = None
+    last_scan: float = 0.0
+    __lock: asyncio.Lock = None
+
+    # Refresh started on behalf of searches, see refresh_shared
+    __refresh_task: Optional[asyncio.Task] = None
+
+    def __init__(
+        self,
+        root: str,
+        file_extensions: Optional[List[str]] = None,
+        context_length: int = 4,
+        excludes: Optional[List[str]] = None,
+    ):
+        self.context_length = context_length
+        self.tracker = ChangeTracker(root, file_extensions, excludes)
+        self.index = TrigramIndex()
+        self.indexed = {}
+        self.large = {}
+        self.corpus = CorpusBlocks()
+        self.__lock = asyncio.Lock()
+
+    def get_view(self) -> "SourceIndex":
+        """
+        What a search reads from, see SharedSource
+        """
+        return self
+
+    async def get_generation(self) -> Tuple[int, List[str], List[Document], Dict]:
+        """
+        (generation, paths, documents, large files) of one consistent
+        generation, no refresh can interleave
+        """
+        async with self.__lock:
+            paths = self.get_paths()
+            documents = await self.get_documents(paths)
+            found = [i for i, document in enumerate(documents) if document is not None]
+
+            return (
+                self.generation,
+                [paths[i] for i in found],
+                [documents[i] for i in found],
+                dict(self.large),
+            )
+
+    async def run_exclusive(self, func: Callable):
+        """
+        Runs func on the executor, no refresh can interleave
+        """
+        async with self.__lock:
+            return await Util.sync_to_async(func)
+
+    def get_paths(self) -> List[str]:
+        """
+        Relative paths in walk order
+        """
+        return [path for path in self.tracker.stats if path in self.indexed]
+
+    def get_large_paths(self) -> List[str]:
+        return [path for path in self.tracker.stats if path in self.large]
+
+    def open_mapped(self, path: str) -> MappedFile:
+        return MappedFile(
+            path,
+            self.tracker.get_abs_path(path),
+            self.large[path],
+            self.context_length,
+        )
+
+    def get_keys(self, paths: List[str]) -> List[Optional[Tuple]]:
+        """
+        DocumentStore keys of the versions of paths in the index right now,
+        None for paths that are not in it
+        """
+        return [self.indexed.get(path) for path in paths]
+
+    async def get_documents(
+        self, paths: List[str], keys: Optional[List[Optional[Tuple]]] = None
+    ) -> List[Optional[Document]]:
+        """
+        The versions of keys (by default the ones in the index right now) of
+        the documents, re-ingesting the ones evicted from the DocumentStore.
+        A refresh can run while a search awaits, so documents that left the
+        index or whose version was replaced on disk since come out as None.
+        """
+        if keys is None:
+            keys = self.get_keys(paths)
+
+        ret = [None if key is None else DocumentStore.get(key) for key in keys]
+        missing = [
+            i for i, key in enumerate(keys) if key is not None and ret[i] is None
+        ]
+
+        if len(missing) > 0:
+            documents = await asyncio.gather(
+                *[
+                    Util.sync_to_async(
+                        functools.partial(self.reingest, paths[i], keys[i])
+                    )
+                    for i in missing
+                ]
+            )
+
+            for i, document in zip(missing, documents):
+                if document is not None:
+                    DocumentStore.put(keys[i], document)
+                    ret[i] = document
+
+        return ret
+
+    async def get_corpus(self) -> CorpusBuffers:
+        """
+        The CorpusBuffer blocks of the source, building the ones that changed
+        or were evicted since they were last used
+        """
+        buffers, missing = self.corpus.get()
+
+        # One block at a time, only its documents are loaded at once
+        for block in missing:
+            paths = block[2]
+            documents = dict(zip(paths, await self.get_documents(paths)))
+
+            built = await Util.sync_to_async(
+                functools.partial(self.corpus.build, [block], documents)
+            )
+
+            # The DocumentStore is not thread-safe, blocks go in from the loop
+            self.corpus.store([block], built)
+            buffers += built
+
+        return CorpusBuffers(buffers)
+
+    def unindex(self, path: str):
+        old = DocumentStore.peek(self.indexed.pop(path))
+        self.index.remove_document(path, None if old is None else old.folded_chunks)
+
+    def ingest(self, path: str, stat: Tuple) -> Document:
+        """
+        stat: of the version being read, as recorded by ChangeTracker
+        """
+        abs_path = self.tracker.get_abs_path(path)
+
+        try:
+            with Metrics.time("read"):
+                lines = Util.read_txt(abs_path)
+
+            Metrics.inc("files_read_total")
+            Metrics.inc("bytes_read_total", stat[1])
+        except Exception as e:
+            # Binary or vanished file, keep it searchable as an empty document
+            Util.warn(f"cannot read {abs_path}: {Util.get_proper_msg(e)}")
+            lines = []
+
+        with Metrics.time("chunk"):
+            return Document.from_lines(path, lines, self.context_length)
+
+    def reingest(self, path: str, key: Tuple) -> Optional[Document]:
+        """
+        The version of key read again, None if the file moved on since
+        """
+        abs_path = self.tracker.get_abs_path(path)
+
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            return None
+
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+        if DocumentStore.get_key(abs_path, stat) != key:
+            return None
+
+        return self.ingest(path, stat)
+
+    async def refresh(
+        self, n_threads: int = 128, force: bool = False, progress: Optional[Dict] = None
+    ) -> bool:
+        """
+        Rescans the source and applies changes, returns True if anything changed
+
+        n_threads: files read at the same time
+        progress: kept up to date with "n_files" to read and "n_read" so far
+        """
+        async with self.__lock:
+            if not force and time.monotonic() - self.last_scan < self.scan_interval:
+                return False
+
+            with Metrics.time("walk"):
+                current, added, changed, removed = await Util.sync_to_async(
+                    self.tracker.scan
+                )
+            self.last_scan = time.monotonic()
+
+            # Every path is recorded once applied, so that the next scan
+            # reports again what a cancelled refresh left out
+            try:
+                for path in removed:
+                    if path in self.large:
+                        del self.large[path]
+                    elif path in self.indexed:
+                        self.unindex(path)
+                        self.corpus.update(path)
+
+                    self.tracker.forget(path)
+
+                to_read = []
+
+                for path in added + changed:
+                    stat = current[path]
+                    self.large.pop(path, None)
+
+                    if stat[1] < self.large_file_bytes:
+                        to_read.append(path)
+                        continue
+
+                    if path in self.indexed:
+                        self.unindex(path)
+                        self.corpus.update(path)
+
+                    self.large[path] = DocumentStore.get_key(
+                        self.tracker.get_abs_path(path), stat
+                    )
+                    self.tracker.record(path, stat)
+
+                if progress is not None:
+                    progress.update({"n_files": len(to_read), "n_read": 0})
+
+                for i in range(0, len(to_read), n_threads):
+                    batch = to_read[i : i + n_threads]
+
+                    documents = await asyncio.gather(
+                        *[
+                            Util.sync_to_async(
+                                functools.partial(self.ingest, path, current[path])
+                            )
+                            for path in batch
+                        ]
+                    )
+
+                    with Metrics.time("index"):
+                        for path, document in zip(batch, documents):
+                            if path in self.indexed:
+                                self.unindex(path)
+
+                            key = DocumentStore.get_key(
+                                self.tracker.get_abs_path(path), current[path]
+                            )
+                            DocumentStore.put(key, document)
+
+                            self.indexed[path] = key
+                            self.index.add_document(path, document.folded_chunks)
+                            self.corpus.update(path, current[path][1])
+                            self.tracker.record(path, current[path])
+
+                    if progress is not None:
+                        progress["n_read"] += len(batch)
+            finally:
+                if len(added) > 0:
+                    self.tracker.sort()
+
+                # Removals of evicted documents are swept in one pass
+                self.index.purge()
+
+                # Also when cut short, results cached for the previous
+                # generation are stale as soon as anything was applied
+                if len(added) + len(changed) + len(removed) > 0:
+                    self.generation += 1
+
+            if len(added) + len(changed) + len(removed) == 0:
+                return False
+
+            Util.debug(
+                f"{self.tracker.root}: +{len(added)} ~{len(changed)} -{len(removed)},"
+                f" generation {self.generation}"
+            )
+
+            return True
+
+    async def refresh_shared(self, n_threads: int = 128) -> bool:
+        """
+        refresh() for searches: concurrent searches wait for the same one, and
+        one that gives up (deadline, client gone) leaves it running to the end
+        """
+        if self.__refresh_task is None or self.__refresh_task.done():
+            self.__refresh_task = asyncio.create_task(self.refresh(n_threads))
+
+            # Its error is reported to the searches still waiting, if any
+            self.__refresh_task.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+
+        return await asyncio.shield(self.__refresh_task)
+
+    def watch(self, interval: float = 2.0):
+        self.tracker.watch(functools.partial(self.refresh, force=True), interval)
@@ -0,0 +1,101 @@
+from array import array
+from typing import Dict, List, Set, Tuple
+
+import numpy
+
+
+class TermDictionary:
+    """
+    Every term ever indexed, with the trigram set of each term precomputed
+    and inverted (trigram -> term ids), so terms similar to a query term are
+    found with one bincount instead of comparing against every term.
+    """
+
+    gram_size = 3
+
+    term_ids: Dict[str, int] = None
+    terms: List[str] = None
+
+    # trigram -> ids of the terms that have it
+    gram_postings: Dict[str, array] = None
+
+    # term id -> size of its trigram set
+    gram_counts: numpy.ndarray = None
+
+    def __init__(self):
+        self.term_ids = {}
+        self.terms = []
+        self.gram_postings = {}
+        self.gram_counts = numpy.zeros(1024, dtype=numpy.float32)
+
+    @classmethod
+    def get_grams(cls, term: str) -> Set[str]:
+        # Padded so that short terms still get grams and word edges weigh more,
+        # the start twice as it is where typos are rarest
+        padded = f"  {term} "
+        return {
+            padded[i : i + cls.gram_size]
+            for i in range(max(len(padded) - cls.gram_size + 1, 1))
+        }
+
+    def add(self, term: str):
+        if term in self.term_ids:
+            return
+
+        term_id = len(self.terms)
+        self.term_ids[term] = term_id
+        self.terms.append(term)
+
+        grams = self.get_grams(term)
+
+        if term_id >= len(self.gram_counts):
+            grown = numpy.zeros(2 * len(self.gram_counts), dtype=numpy.float32)
+            grown[: len(self.gram_counts)] = self.gram_counts
+            self.gram_counts = grown
+
+        self.gram_counts[term_id] = len(grams)
+
+        for gram in grams:
+            posting = self.gram_postings.get(gram)
+
+            if posting is None:
+                posting = self.gram_postings[gram] = array("i")
+
+            posting.append(term_id)
+
+    def get_gram_posting(self, gram: str) -> numpy.ndarray:
+        """
+        Ids of the terms that have gram
+        """
+        posting = self.gram_postings.get(gram)
+
+        if posting is None:
+            return numpy.zeros(0, dtype=numpy.int32)
+
+        return numpy.frombuffer(posting, dtype=numpy.int32)
+
+    def find_similar(self, term: str, threshold: float) -> List[Tuple[str, float]]:
+        """
+        Terms whose trigram Jaccard similarity with term is at least threshold
+        """
+        grams = self.get_grams(term)
+        postings = [
+            posting
+            for posting in (self.get_gram_posting(gram) for gram in grams)
+            if len(posting) > 0
+        ]
+
+        if len(postings) == 0:
+            return []
+
+        n_terms = len(self.terms)
+        shared = numpy.bincount(numpy.concatenate(postings), minlength=n_terms)
+        del postings
+
+        similarity = shared / (len(grams) + self.gram_counts[:n_terms] - shared)
+        term_ids = numpy.flatnonzero(similarity >= threshold)
+
+        return [
+            (self.terms[term_id], float(similarity[term_id]))
+            for term_id in term_ids.tolist()
+        ]
@@ -0,0 +1,118 @@
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy
+
+from src.core.term_dictionary import TermDictionary
+
+
+class TermIndex:
+    """
+    Word-level statistics of one source's chunks, collected at index time for
+    relevance ranking: term frequency per chunk, document frequency per term
+    (the size of its posting) and chunk lengths. Terms also go into a
+    TermDictionary for typo-tolerant lookups.
+    """
+
+    token_pattern = re.compile(r"\w+")
+
+    # term -> {chunk id: term frequency}
+    postings: Dict[str, Dict[int, int]] = None
+
+    # chunk id -> number of tokens, 0 for free ids
+    chunk_lengths: numpy.ndarray = None
+
+    n_chunks: int = 0
+    total_length: int = 0
+    dictionary: TermDictionary = None
+
+    def __init__(self):
+        self.postings = {}
+        self.dictionary = TermDictionary()
+        self.chunk_lengths = numpy.zeros(1024, dtype=numpy.float32)
+        self.n_chunks = 0
+        self.total_length = 0
+
+    @classmethod
+    def tokenize(cls, folded_text: str) -> List[str]:
+        return cls.token_pattern.findall(folded_text)
+
+    def get_avg_length(self) -> float:
+        return self.total_length / self.n_chunks if self.n_chunks > 0 else 0.0
+
+    def get_posting(self, term: str) -> Optional[Tuple[numpy.ndarray, numpy.ndarray]]:
+        """
+        (chunk ids, term frequencies) of the chunks that have term, None if
+        there is none
+        """
+        posting = self.postings.get(term)
+
+        if posting is None:
+            return None
+
+        return (
+            numpy.fromiter(posting.keys(), numpy.int64, len(posting)),
+            numpy.fromiter(posting.values(), numpy.float32, len(posting)),
+        )
+
+    def add_chunk(self, chunk_id: int, folded_chunk: str):
+        tokens = self.tokenize(folded_chunk)
+
+        if chunk_id >= len(self.chunk_lengths):
+            # Grow by doubling, readers keep working on the old array
+            grown = numpy.zeros(
+                max(chunk_id + 1, 2 * len(self.chunk_lengths)), dtype=numpy.float32
+            )
+            grown[: len(self.chunk_lengths)] = self.chunk_lengths
+            self.chunk_lengths = grown
+
+        self.chunk_lengths[chunk_id] = len(tokens)
+        self.n_chunks += 1
+        self.total_length += len(tokens)
+
+        for term, tf in Counter(tokens).items():
+            posting = self.postings.get(term)
+
+            if posting is None:
+                posting = self.postings[term] = {}
+                self.dictionary.add(term)
+
+            posting[chunk_id] = tf
+
+    def remove_chunk(self, chunk_id: int, folded_chunk: Optional[str] = None):
+        """
+        Without folded_chunk, only the chunk's length is dropped and its
+        postings must be cleaned with purge()
+        """
+        self.total_length -= int(self.chunk_lengths[chunk_id])
+        self.chunk_lengths[chunk_id] = 0
+        self.n_chunks -= 1
+
+        if folded_chunk is None:
+            return
+
+        for term in set(self.tokenize(folded_chunk)):
+            posting = self.postings.get(term)
+
+            if posting is None:
+                continue
+
+            posting.pop(chunk_id, None)
+
+            if len(posting) == 0:
+                del self.postings[term]
+
+    def purge(self, chunk_ids: Set[int]):
+        for term in list(self.postings.keys()):
+            posting = self.postings[term]
+
+            if len(chunk_ids) < len(posting):
+                for chunk_id in chunk_ids:
+                    posting.pop(chunk_id, None)
+            else:
+                for chunk_id in [c for c in posting if c in chunk_ids]:
+                    del posting[chunk_id]
+
+            if len(posting) == 0:
+                del self.postings[term]
@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.core.term_index import TermIndex
+
+
+class TrigramIndex:
+    """
+    Case-folded trigram posting lists over the chunks of one source.
+
+    A chunk can only contain a keyword if it contains every trigram of that
+    keyword, so intersecting posting lists gives a candidate set that is then
+    verified by SearchSys.find_in_file.
+
+    Word statistics for relevance ranking are collected on the way, under the
+    same chunk ids, in terms.
+    """
+
+    gram_size = 3
+
+    postings: Dict[str, Set[int]] = None
+    chunk_refs: List[Optional[Tuple[str, int]]] = None
+    doc_chunk_ids: Dict[str, List[int]] = None
+    free_ids: List[int] = None
+    orphan_ids: Set[int] = None
+    terms: TermIndex = None
+
+    def __init__(self):
+        self.postings = {}
+
+        # chunk id -> (relative path, chunk index within the document)
+        self.chunk_refs = []
+        self.doc_chunk_ids = {}
+
+        # Ids of removed chunks, reused by later documents
+        self.free_ids = []
+
+        # Ids of removed chunks whose text was no longer at hand, see purge()
+        self.orphan_ids = set()
+        self.terms = TermIndex()
+
+    @classmethod
+    def get_trigrams(cls, text: str) -> Set[str]:
+        folded = text.casefold()
+        return {
+            folded[i : i + cls.gram_size]
+            for i in range(len(folded) - cls.gram_size + 1)
+        }
+
+    def add_document(self, path: str, chunks: List[str]):
+        chunk_ids = self.doc_chunk_ids[path] = []
+
+        for chunk_idx, chunk in enumerate(chunks):
+            if len(self.free_ids) > 0:
+                chunk_id = self.free_ids.pop()
+                self.chunk_refs[chunk_id] = (path, chunk_idx)
+            else:
+                chunk_id = len(self.chunk_refs)
+                self.chunk_refs.append((path, chunk_idx))
+
+            chunk_ids.append(chunk_id)
+            self.terms.add_chunk(chunk_id, chunk)
+
+            for gram in self.get_trigrams(chunk):
+                posting = self.postings.get(gram)
+
+                if posting is None:
+                    posting = self.postings[gram] = set()
+
+                posting.add(chunk_id)
+
+    def remove_document(self, path: str, chunks: Optional[List[str]] = None):
+        """
+        chunks: the chunks the document was added with. When they are gone
+        (e.g. evicted from the DocumentStore) the chunk ids are only marked as
+        orphans, and purge() removes them from every posting in one sweep.
+        """
+        chunk_ids = self.doc_chunk_ids.pop(path, [])
+
+        if chunks is None:
+            for chunk_id in chunk_ids:
+                self.chunk_refs[chunk_id] = None
+                self.terms.remove_chunk(chunk_id)
+
+            self.orphan_ids.update(chunk_ids)
+            return
+
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            for gram in self.get_trigrams(chunk):
+                posting = self.postings.get(gram)
+
+                if posting is None:
+                    continue
+
+                posting.discard(chunk_id)
+
+                if len(posting) == 0:
+                    del self.postings[gram]
+
+            self.terms.remove_chunk(chunk_id, chunk)
+            self.chunk_refs[chunk_id] = None
+            self.free_ids.append(chunk_id)
+
+    def purge(self):
+        """
+        Drops orphan chunk ids from all postings, then frees them
+        """
+        if len(self.orphan_ids) == 0:
+            return
+
+        for gram in list(self.postings.keys()):
+            posting = self.postings[gram]
+            posting -= self.orphan_ids
+
+            if len(posting) == 0:
+                del self.postings[gram]
+
+        self.terms.purge(self.orphan_ids)
+        self.free_ids += list(self.orphan_ids)
+        self.orphan_ids = set()
+
+    def lookup_ids(self, keyword: str) -> Optional[Set[int]]:
+        """
+        Returns ids of the chunks that contain every trigram of keyword, or
+        None when the keyword is too short to be answered by the index.
+        """
+        grams = self.get_trigrams(keyword)
+
+        if len(grams) == 0:
+            return None
+
+        # Intersect the most selective posting lists first
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+
+        chunk_ids = set(postings[0])
+        for posting in postings[1:]:
+            if len(chunk_ids) == 0:
+                break
+            chunk_ids &= posting
+
+        return chunk_ids
+
+    def get_chunk_ref(self, chunk_id: int) -> Optional[Tuple[str, int]]:
+        """
+        (relative path, chunk index) of a chunk id, None for an orphan
+        """
+        return self.chunk_refs[chunk_id]
+
+    def group_ids(self, chunk_ids: Set[int]) -> Dict[str, Set[int]]:
+        """
+        Maps chunk ids to {relative path: chunk indexes}
+        """
+        ret: Dict[str, Set[int]] = {}
+        for chunk_id in chunk_ids:
+            ref = self.chunk_refs[chunk_id]
+
+            # Orphans stay in the postings until the refresh purges them
+            if ref is not None:
+                ret.setdefault(ref[0], set()).add(ref[1])
+
+        return ret
+
+    def lookup(self, keyword: str) -> Optional[Dict[str, Set[int]]]:
+        """
+        Returns {relative path: candidate chunk indexes}, or None when the
+        keyword is too short to be answered by the index and a scan is needed.
+        """
+        chunk_ids = self.lookup_ids(keyword)
+
+        return None if chunk_ids is None else self.group_ids(chunk_ids)
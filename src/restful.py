@@ -1,22 +1,178 @@
 import asyncio
+import contextlib
 import copy
 import datetime
 import os
 import sys
+import time
 import uvicorn
+from functools import partial
 from fastapi import FastAPI
 import ssl
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from typing import Dict, List, Optional
+from starlette.responses import PlainTextResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from starlette.websockets import WebSocket
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from src.core.document_store import DocumentStore
+from src.core.match_grouper import MatchGrouper
+from src.core.matcher import FuzzyMatcher, Matcher
+from src.core.process_backend import ProcessBackend
+from src.core.result_cache import ResultCache
 from src.core.search_sys import SearchSys
+from src.core.shared_corpus import SharedCorpus
+from src.core.source_index import SourceIndex
 from src.utils.config import Config
+from src.utils.metrics import Metrics
 from src.utils.util import Util
+from src.web.compression import CompressionMiddleware
 from src.web.web_util import WebUtil
 
-app = FastAPI()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Restores the sources' index snapshots before serving, saves them on
+    shutdown so that the next start is warm. With shared_corpus_dir, only
+    the worker that wins the builder lock indexes the sources and publishes
+    them there, the others map what it published.
+    """
+    snapshot_dir = Config.get_optional_param("snapshot_dir", None)
+    shared_dir = Config.get_optional_param("shared_corpus_dir", None)
+    is_builder = shared_dir is not None and SharedCorpus.try_lead(shared_dir)
+
+    if shared_dir is not None and not is_builder:
+        SearchSys.shared_dir = shared_dir
+        snapshot_dir = None
+
+    if snapshot_dir is not None:
+        # Before any watcher or search can touch the sources
+        for s in Config.get_config_param("sources", []):
+            local, extension = get_source_location(s)
+
+            if await SearchSys.load_snapshot(snapshot_dir, local, extension):
+                Util.info(f"source {s['name']} restored from its snapshot")
+
+    warm_up_task = None
+    publish_task = None
+
+    if Config.get_optional_param("warm_up", True):
+        warm_up_task = asyncio.create_task(warm_up())
+    else:
+        warm_up_state["ready"] = True
+
+    if is_builder:
+        Util.info(f"building the shared corpora in {shared_dir}")
+        publish_task = asyncio.create_task(publish_corpora(shared_dir))
+
+    yield
+
+    for task in [warm_up_task, publish_task]:
+        if task is not None and not task.done():
+            task.cancel()
+
+    if snapshot_dir is not None:
+        await SearchSys.save_snapshots(snapshot_dir)
+
+
+async def warm_up():
+    """
+    Indexes every source (and ships it to the process workers) before the
+    first search needs it. Sources are done one after another, reading at
+    most warm_up_concurrency files at a time so that serving is not starved.
+    """
+    start_time = Util.time_now()
+    sources: List[Dict] = Config.get_config_param("sources", [])
+    n_threads = int(Config.get_optional_param("warm_up_concurrency", 32))
+
+    warm_up_state.update({"n_sources": len(sources), "n_warm": 0})
+
+    for s in sources:
+        local, extension = get_source_params(s)
+        source = SearchSys.get_source(local, extension)
+        progress = {"source": s["name"], "n_files": 0, "n_read": 0}
+        warm_up_state["current"] = progress
+
+        try:
+            if source.is_shared:
+                await wait_published(source, progress)
+            else:
+                await asyncio.shield(source.refresh(n_threads, True, progress))
+
+            if ProcessBackend.executors is not None and not source.is_shared:
+                await ProcessBackend.sync(
+                    SearchSys.get_source_key(local, extension), source
+                )
+        except Exception as e:
+            # A broken source must not keep the others cold
+            Util.error(e)
+            warm_up_state["errors"].append(
+                {"source": s["name"], "error": Util.get_proper_msg(e)}
+            )
+
+        warm_up_state["n_warm"] += 1
+        Util.info(
+            f"warm-up: {s['name']} ready ({progress['n_read']} files read),"
+            f" {warm_up_state['n_warm']}/{len(sources)} sources"
+        )
+
+    warm_up_state["current"] = None
+    warm_up_state["ready"] = True
+    warm_up_state["elapsed_time"] = Util.get_elapsed_time_ms_str(start_time)
+
+    Util.info(f"warm-up done in {warm_up_state['elapsed_time']}")
+
+    snapshot_dir = Config.get_optional_param("snapshot_dir", None)
+
+    # Nothing is lost to a crash from here on
+    if snapshot_dir is not None:
+        await SearchSys.save_snapshots(snapshot_dir)
+
+
+async def wait_published(source: SourceIndex, progress: Dict):
+    while True:
+        try:
+            await source.refresh(progress=progress)
+            return
+        except Exception as e:
+            Util.debug(Util.get_proper_msg(e))
+            await asyncio.sleep(0.5)
+
+
+async def publish_corpora(shared_dir: str):
+    """
+    Builder side of shared_corpus_dir: keeps the sources up to date and
+    publishes every new generation
+    """
+    sources: List[Dict] = Config.get_config_param("sources", [])
+    interval = float(Config.get_optional_param("shared_corpus_interval", 2.0))
+    n_threads = int(Config.get_optional_param("warm_up_concurrency", 32))
+
+    while True:
+        for s in sources:
+            try:
+                await SearchSys.get_source(*get_source_params(s)).refresh(n_threads)
+            except Exception as e:
+                Util.error(e)
+
+        await SearchSys.publish_shared(shared_dir)
+        await asyncio.sleep(interval)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Created on first use, see get_source_slots
+source_slots: Optional[asyncio.Semaphore] = None
+
+# Progress of the start-up indexing, see warm_up and /readyz
+warm_up_state: Dict = {
+    "ready": False,
+    "n_sources": 0,
+    "n_warm": 0,
+    "current": None,
+    "errors": [],
+}
 
 
 def make_dict_jsonable(input_dict: Dict):
@@ -32,6 +188,373 @@ def make_dict_jsonable(input_dict: Dict):
     return ret
 
 
+def get_source_location(s: Dict):
+    local: str = s["source"]
+    extension: Optional[List[str]] = Util.read_map_value(s, "extension", None)
+
+    if not local.startswith("/"):  # Relative Path
+        local = Util.get_abs_path(local)
+
+    # gitignore-style rules, on top of the .gitignore files in the source
+    excludes: Optional[List[str]] = Util.read_map_value(s, "exclude", None)
+
+    if excludes is not None:
+        SearchSys.get_source(local, extension, excludes)
+
+    return local, extension
+
+
+def get_source_params(s: Dict):
+    local, extension = get_source_location(s)
+
+    # Poll for file changes in the background instead of on query
+    if Util.read_map_value(s, "watch", False):
+        SearchSys.get_source(local, extension).watch()
+
+    return local, extension
+
+
+def decorate_matches(s: Dict, results: List[Dict]) -> List[Dict]:
+    remote: str = s["remote"]
+    is_jekyll: bool = Util.read_map_value(s, "jekyll", False)
+
+    return [
+        {
+            **r,
+            # Support jekyll
+            "remote_path": (remote + r["path"])
+            if not is_jekyll
+            else (remote + r["path"]).replace(
+                # Extension
+                "." + r["path"].split(".")[-1],
+                # Jekyll's param ending
+                ".html?print-pdf#/",
+            ),
+            "source": s["name"],
+        }
+        for r in results
+    ]
+
+
+# Fields shared by every match of a file, sent once per file in compact responses
+DOCUMENT_FIELDS = ["path", "title", "remote_path", "source"]
+MATCH_FIELDS = ["doc", "type", "keyword", "priority", "score", "line", "chunk"]
+
+
+def compact_matches(matches: List[Dict]) -> Dict:
+    """
+    Matches as a table of the documents they come from and one row per
+    match, in MATCH_FIELDS order, whose "doc" is an index into that table
+    and whose chunk is its lines joined with newlines
+    """
+    documents = []
+    doc_nos = {}
+    rows = []
+
+    for match in matches:
+        # A path is unique within its source
+        doc_key = (match.get("source"), match["path"])
+        doc_no = doc_nos.get(doc_key)
+
+        if doc_no is None:
+            doc_no = doc_nos[doc_key] = len(documents)
+            documents.append([match.get(field) for field in DOCUMENT_FIELDS])
+
+        rows.append(
+            [
+                doc_no,
+                match["type"],
+                match["keyword"],
+                match["priority"],
+                match.get("score"),
+                match.get("line"),
+                "\n".join(match["chunk"]),
+            ]
+        )
+
+    return {
+        "input_keyword": matches[0]["input_keyword"] if len(matches) > 0 else None,
+        "document_fields": DOCUMENT_FIELDS,
+        "documents": documents,
+        "match_fields": MATCH_FIELDS,
+        "matches": rows,
+    }
+
+
+def get_search_params(body: Dict):
+    WebUtil.ensure_valid_request(body, "keyword")
+    keyword = Util.read_map_value(body, "keyword", "no_keyword")
+    n_threads = int(Util.read_map_value(body, "n_threads", "128"))
+    backend = Util.read_map_value(
+        body, "backend", Config.get_optional_param("backend", "thread")
+    )
+    mode = Util.read_map_value(body, "mode", "exact")
+
+    # Only what the configuration started can be asked for
+    ProcessBackend.ensure_backend(backend)
+
+    return keyword, n_threads, backend, mode
+
+
+def get_page_params(body: Dict, keyword: str):
+    """
+    Returns (offset, limit) from either offset/limit or an opaque cursor
+    returned by a previous page. limit is None when everything is wanted.
+    """
+    limit = Util.read_map_value(body, "limit", None)
+    offset = int(Util.read_map_value(body, "offset", "0"))
+    cursor = Util.read_map_value(body, "cursor", None)
+
+    if cursor is not None:
+        state = WebUtil.decode_cursor(cursor)
+
+        if state["keyword"] != keyword:
+            raise Exception("cursor belongs to another keyword")
+
+        offset, limit = state["offset"], state["limit"]
+
+    if limit is not None:
+        limit = int(limit)
+
+        if limit <= 0 or offset < 0:
+            raise Exception(f"bad page: offset {offset}, limit {limit}")
+
+    return offset, limit
+
+
+def get_deadline(body: Dict) -> Optional[float]:
+    """
+    time.monotonic() by which the search should wrap up, from deadline_ms
+    """
+    deadline_ms = Util.read_map_value(body, "deadline_ms", None)
+
+    if deadline_ms is None:
+        return None
+
+    return time.monotonic() + float(deadline_ms) / 1000.0
+
+
+def get_source_slots() -> asyncio.Semaphore:
+    """
+    Process-wide budget of sources being searched at the same time
+    """
+    global source_slots
+
+    if source_slots is None:
+        source_slots = asyncio.Semaphore(
+            Config.get_optional_param("max_concurrent_sources", 8)
+        )
+
+    return source_slots
+
+
+def get_source_timeout(s: Dict) -> float:
+    return (
+        float(
+            Util.read_map_value(
+                s, "timeout_ms", Config.get_optional_param("source_timeout_ms", 30000)
+            )
+        )
+        / 1000.0
+    )
+
+
+def get_source_deadline(s: Dict) -> float:
+    """
+    time.monotonic() by which a source starting now must be done, all of its
+    work for one request included
+    """
+    return time.monotonic() + get_source_timeout(s)
+
+
+async def run_with_deadline(
+    s: Dict,
+    start_work: Callable[[], Awaitable],
+    source_deadline: Optional[float] = None,
+) -> Tuple[Dict, Any]:
+    """
+    Starts one source's work once the concurrency budget allows it, under the
+    source's deadline (see get_source_deadline, from now when not given).
+    Returns (status of the source, result or None if the work failed or timed
+    out)
+    """
+    start_time = Util.time_now()
+    status = {"name": s["name"], "status": "ok"}
+    ret = None
+
+    if source_deadline is None:
+        source_deadline = get_source_deadline(s)
+
+    async def run():
+        async with get_source_slots():
+            return await start_work()
+
+    try:
+        ret = await asyncio.wait_for(
+            run(), max(source_deadline - time.monotonic(), 0.0)
+        )
+    except asyncio.TimeoutError:
+        Util.warn(f"source {s['name']} missed its deadline")
+        status["status"] = "timeout"
+    except Exception as e:
+        Util.error(e)
+        status["status"] = "error"
+        status["error"] = Util.get_proper_msg(e)
+
+    status["elapsed_time"] = Util.get_elapsed_time_ms_str(start_time)
+
+    return status, ret
+
+
+async def search_sources(
+    sources: List[Dict],
+    keyword: str,
+    n_threads: int,
+    backend: str,
+    mode: str,
+    n_wanted: Optional[int],
+    deadline: Optional[float] = None,
+    source_deadlines: Optional[List[float]] = None,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Searches all sources concurrently. Returns (status of every source, ranked
+    matches complete up to the first n_wanted of the sources that made it)
+
+    source_deadlines: of every source, see get_source_deadline
+    """
+    if source_deadlines is None:
+        source_deadlines = [get_source_deadline(s) for s in sources]
+
+    async def search(s: Dict):
+        local, extension = get_source_params(s)
+        stats = {}
+
+        results = await SearchSys.find_in_files(
+            local,
+            keyword,
+            n_threads=n_threads,
+            file_extensions=extension,
+            backend=backend,
+            mode=mode,
+            limit=n_wanted,
+            deadline=deadline,
+            stats=stats,
+        )
+
+        return stats, decorate_matches(s, results)
+
+    outcomes = await asyncio.gather(
+        *[
+            run_with_deadline(s, partial(search, s), source_deadline)
+            for s, source_deadline in zip(sources, source_deadlines)
+        ]
+    )
+
+    statuses = []
+    ret = []
+
+    for status, outcome in outcomes:
+        if outcome is not None:
+            stats, results = outcome
+            ret += results
+
+            # Cut short by the request's deadline
+            if stats.get("partial", False):
+                status["status"] = "partial"
+
+        statuses.append(status)
+
+    with Metrics.time("merge"):
+        ret.sort(key=SearchSys.get_rank)
+
+    return statuses, ret
+
+
+async def search_all(
+    keyword: str,
+    n_threads: int,
+    backend: str,
+    mode: str,
+    n_wanted: Optional[int],
+    deadline: Optional[float] = None,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    search_sources over every configured source, through the result cache
+    """
+    sources: List[Dict] = Config.get_config_param("sources", [])
+
+    # Bad queries fail the request before any source is searched
+    Matcher.create(keyword, mode)
+
+    # Refreshing and searching a source share one budget
+    source_deadlines = [get_source_deadline(s) for s in sources]
+
+    # The request's own deadline bounds the refresh too
+    refresh_deadlines = [
+        source_deadline if deadline is None else min(source_deadline, deadline)
+        for source_deadline in source_deadlines
+    ]
+
+    # Bring every source up to date first, cached results are only valid
+    # for the generations they were computed at
+    indexes = [SearchSys.get_source(*get_source_params(s)) for s in sources]
+
+    async def refresh(index):
+        # A refresh cut by a deadline or a cancellation finishes in the
+        # background instead of leaving the index half updated
+        await index.refresh_shared(n_threads)
+
+    refreshed = await asyncio.gather(
+        *[
+            run_with_deadline(s, partial(refresh, index), refresh_deadline)
+            for s, index, refresh_deadline in zip(sources, indexes, refresh_deadlines)
+        ]
+    )
+    refresh_statuses = [status for status, _ in refreshed]
+
+    for status, source_deadline in zip(refresh_statuses, source_deadlines):
+        # Cut by the request's deadline rather than the source's
+        if status["status"] == "timeout" and deadline is not None:
+            if deadline < source_deadline:
+                status["status"] = "partial"
+    is_fresh = all(status["status"] == "ok" for status in refresh_statuses)
+
+    cache_key = ResultCache.get_key(
+        keyword,
+        mode,
+        [SearchSys.get_source_key(*get_source_params(s)) for s in sources],
+        [index.generation for index in indexes],
+    )
+    ret = ResultCache.get(cache_key, n_wanted) if is_fresh else None
+
+    if ret is not None:
+        return [{"name": s["name"], "status": "cached"} for s in sources], ret
+
+    # Sources that could not even be brought up to date are left out
+    is_ok = [status["status"] == "ok" for status in refresh_statuses]
+    search_statuses, ret = await search_sources(
+        [s for s, ok in zip(sources, is_ok) if ok],
+        keyword,
+        n_threads,
+        backend,
+        mode,
+        n_wanted,
+        deadline,
+        [source_deadline for source_deadline, ok in zip(source_deadlines, is_ok) if ok],
+    )
+    search_statuses = iter(search_statuses)
+    statuses = [
+        next(search_statuses) if status["status"] == "ok" else status
+        for status in refresh_statuses
+    ]
+
+    # Never cache what a slow or failing source left out
+    if all(status["status"] == "ok" for status in statuses):
+        ResultCache.put(cache_key, n_wanted, ret)
+
+    return statuses, ret
+
+
 @app.get("/search")
 @app.post("/search")
 async def normal_search(request: Request):
@@ -39,52 +562,67 @@ async def normal_search(request: Request):
         start_time = Util.time_now()
 
         body = await WebUtil.get_params(request)
+        keyword, n_threads, backend, mode = get_search_params(body)
+        offset, limit = get_page_params(body, keyword)
+        deadline = get_deadline(body)
+        response_format = Util.read_map_value(body, "format", "full")
 
-        WebUtil.ensure_valid_request(body, "keyword")
-        keyword = Util.read_map_value(body, "keyword", "no_keyword")
-        n_threads = int(Util.read_map_value(body, "n_threads", "128"))
+        if response_format not in ["full", "compact", "grouped"]:
+            raise Exception(f"unknown response format: {response_format}")
 
-        sources: List[Dict] = Config.get_config_param("sources", [])
+        # Opt-in breakdown of where the time went, see Metrics.collect
+        timings = None
 
-        ret = []
+        if Util.str_to_bool(Util.read_map_value(body, "timings", False)):
+            timings = Metrics.collect()
 
-        # Iterate through each source
-        for s in sources:
-            local: str = s["source"]
-            remote: str = s["remote"]
-            is_jekyll: bool = Util.read_map_value(s, "jekyll", False)
-            extension: Optional[List[str]] = Util.read_map_value(s, "extension", None)
-
-            if not local.startswith("/"):  # Relative Path
-                local = Util.get_abs_path(local)
+        # Number of top matches needed to cut this page
+        n_wanted = None if limit is None else offset + limit + 1
 
-            results = await SearchSys.find_in_files(
-                local, keyword, n_threads=n_threads, file_extensions=extension
+        # Nobody is waiting for the results of a client that went away
+        with Metrics.time("search"):
+            statuses, ret = await WebUtil.run_until_disconnected(
+                request,
+                search_all(keyword, n_threads, backend, mode, n_wanted, deadline),
             )
 
-            ret += [
-                {
-                    **r,
-                    # Support jekyll
-                    "remote_path": (remote + r["path"])
-                    if not is_jekyll
-                    else (remote + r["path"]).replace(
-                        # Extension
-                        "." + r["path"].split(".")[-1],
-                        # Jekyll's param ending
-                        ".html?print-pdf#/",
-                    ),
-                    "source": s["name"],
-                }
-                for r in results
-            ]
+        content = {
+            "partial": any(
+                status["status"] not in ("ok", "cached") for status in statuses
+            ),
+            "sources": statuses,
+        }
 
-        ret.sort(key=lambda entry: entry["priority"])
+        if timings is not None:
+            content["timings"] = {
+                stage: round(ms, 3) for stage, ms in sorted(timings.items())
+            }
+
+        if limit is not None:
+            # One extra match was asked for to tell whether there is a next page
+            if len(ret) > offset + limit:
+                content["next_cursor"] = WebUtil.encode_cursor(
+                    {"keyword": keyword, "offset": offset + limit, "limit": limit}
+                )
+            else:
+                content["next_cursor"] = None
+
+            ret = ret[offset : offset + limit]
+
+        if response_format == "compact":
+            matches = compact_matches(ret)
+        elif response_format == "grouped":
+            matches = {
+                "documents": MatchGrouper.group(ret, Matcher.create(keyword, mode))
+            }
+        else:
+            matches = {"matches": ret}
 
         return WebUtil.make_success(
             {
                 "elapsed_time": Util.get_elapsed_time_ms_str(start_time),
-                "matches": ret,
+                **matches,
+                **content,
             }
         )
 
@@ -93,9 +631,182 @@ async def normal_search(request: Request):
         return WebUtil.make_error(e)
 
 
-def start_server(host: str = "0.0.0.0", port: int = 3000):
-    global app
+async def iter_search(body: Dict) -> AsyncIterator[Dict]:
+    """
+    Yields one frame per finished batch, then a final frame with the timing
+    """
+    start_time = Util.time_now()
+    n_matches = 0
+
+    try:
+        keyword, n_threads, backend, mode = get_search_params(body)
+        limit = Util.read_map_value(body, "limit", None)
+        limit = None if limit is None else int(limit)
+        deadline = get_deadline(body)
+        stats = {}
+
+        for s in Config.get_config_param("sources", []):
+            if limit is not None and n_matches >= limit:
+                break
+
+            if SearchSys.is_past(deadline, stats):
+                break
+
+            local, extension = get_source_params(s)
+
+            async for batch in SearchSys.iter_matches(
+                local,
+                keyword,
+                n_threads=n_threads,
+                file_extensions=extension,
+                backend=backend,
+                mode=mode,
+                limit=None if limit is None else limit - n_matches,
+                deadline=deadline,
+                stats=stats,
+            ):
+                if len(batch) == 0:
+                    continue
+
+                batch.sort(key=SearchSys.get_rank)
+
+                # Streamed matches are not ranked, limit just caps their number
+                if limit is not None:
+                    batch = batch[: limit - n_matches]
+
+                n_matches += len(batch)
+
+                yield {"matches": decorate_matches(s, batch)}
+
+                if limit is not None and n_matches >= limit:
+                    break
+
+        yield {
+            "done": True,
+            "partial": stats.get("partial", False),
+            "elapsed_time": Util.get_elapsed_time_ms_str(start_time),
+            "n_matches": n_matches,
+        }
 
+    except Exception as e:
+        Util.error(e)
+        yield {
+            "done": True,
+            "error": Util.get_proper_msg(e),
+            "elapsed_time": Util.get_elapsed_time_ms_str(start_time),
+            "n_matches": n_matches,
+        }
+
+
+@app.get("/search/stream")
+@app.post("/search/stream")
+async def stream_search(request: Request):
+    """
+    Streams /search results as NDJSON, or as server-sent events with format=sse
+    """
+    try:
+        body = await WebUtil.get_params(request)
+        is_sse = Util.read_map_value(body, "format", "ndjson") == "sse"
+
+        return WebUtil.make_stream(iter_search(body), is_sse)
+
+    except Exception as e:
+        Util.error(e)
+        return WebUtil.make_error(e)
+
+
+@app.websocket("/search/ws")
+async def websocket_search(websocket: WebSocket):
+    """
+    Every JSON message received is a search, answered with the same frames
+    as /search/stream
+    """
+    await websocket.accept()
+
+    try:
+        while True:
+            body = await websocket.receive_json()
+
+            async for frame in iter_search(body):
+                await websocket.send_text(WebUtil.dumps(frame).decode())
+
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """
+    Stage latency histograms, counters and cache gauges in the Prometheus
+    text format
+    """
+    return PlainTextResponse(
+        Metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def get_executor_queue_depth() -> Optional[int]:
+    # Jobs waiting for a thread of the default executor
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    work_queue = getattr(executor, "_work_queue", None)
+
+    return None if work_queue is None else work_queue.qsize()
+
+
+Metrics.register_gauge(
+    "result_cache_hit_ratio",
+    "Share of /search lookups answered by the result cache",
+    lambda: ResultCache.stats().get("hit_ratio"),
+)
+Metrics.register_gauge(
+    "document_store_hit_ratio",
+    "Share of document lookups answered without reading the file again",
+    lambda: DocumentStore.stats()["hit_ratio"],
+)
+Metrics.register_gauge(
+    "document_store_bytes",
+    "Estimated size of the documents held in memory",
+    lambda: DocumentStore.stats()["bytes"],
+)
+Metrics.register_gauge(
+    "executor_queue_depth",
+    "Jobs waiting for a thread of the default executor",
+    get_executor_queue_depth,
+)
+
+
+@app.get("/healthz")
+async def get_health(request: Request):
+    """
+    The process is up and serving
+    """
+    return WebUtil.make_success({"alive": True})
+
+
+@app.get("/readyz")
+async def get_readiness(request: Request):
+    """
+    200 once every source is indexed, 503 with the warm-up progress until then
+    """
+    return WebUtil.make_response(
+        warm_up_state,
+        is_good=warm_up_state["ready"],
+        status_code=200 if warm_up_state["ready"] else 503,
+    )
+
+
+@app.get("/stats")
+async def get_stats(request: Request):
+    return WebUtil.make_success(
+        {"result_cache": ResultCache.stats(), "document_store": DocumentStore.stats()}
+    )
+
+
+def setup_app() -> FastAPI:
+    """
+    Applies the configuration to this process' app. Passed to uvicorn as a
+    factory when there are several workers, so that every one of them runs it.
+    """
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],  #
@@ -104,6 +815,36 @@ def start_server(host: str = "0.0.0.0", port: int = 3000):
         allow_headers=["*"],
     )
 
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=Config.get_optional_param("compress_min_bytes", 1024),
+    )
+
+    ResultCache.init(Config.get_optional_param("result_cache_mb", 64) * 1024 * 1024)
+    DocumentStore.init(
+        Config.get_optional_param("document_cache_mb", 256) * 1024 * 1024
+    )
+
+    SourceIndex.large_file_bytes = (
+        Config.get_optional_param("large_file_mb", 8) * 1024 * 1024
+    )
+
+    FuzzyMatcher.threshold = float(Config.get_optional_param("fuzzy_threshold", 0.4))
+
+    if Config.get_optional_param("backend", "thread") == "process":
+        ProcessBackend.init(Config.get_optional_param("n_processes", None))
+
+    return app
+
+
+def start_server(host: str = "0.0.0.0", port: int = 3000):
+    n_workers = int(Config.get_optional_param("workers", 1))
+
+    if n_workers > 1:
+        target = {"app": "src.restful:setup_app", "factory": True, "workers": n_workers}
+    else:
+        target = {"app": setup_app()}
+
     try:
     
         if Config.get_config_param("https",False,bool):
@@ -114,11 +855,11 @@ def start_server(host: str = "0.0.0.0", port: int = 3000):
             if cert_path is None or privkey_path is None:
                 raise Exception("Either cert path or privkey path cannot be read!")
         
-        uvicorn.run(app, host=host, port=port,ssl_keyfile=privkey_path,ssl_certfile=cert_path)
+        uvicorn.run(**target, host=host, port=port,ssl_keyfile=privkey_path,ssl_certfile=cert_path)
     except Exception as e:
         Util.error(e)
         Util.info("Falling back to HTTP mode...")
-        uvicorn.run(app, host=host, port=port)
+        uvicorn.run(**target, host=host, port=port)
 
     Util.info(f"Naive-doc-search is alive at address {host}:{port}!")
 
@@ -15,11 +15,7 @@ class Config:
         config_path: str = None,
     ) -> Any:
         try:
-            if cls.data is None:
-                if config_path is None:
-                    config_path = Util.get_abs_path("config.json")
-
-                cls.data = Util.read_json(config_path)
+            cls.load(config_path)
 
             if key not in cls.data:
                 raise Exception(f"missing key: {key}")
@@ -34,6 +30,28 @@ class Config:
             else:
                 return default_value
 
+    @classmethod
+    def load(cls, config_path: str = None):
+        if cls.data is None:
+            if config_path is None:
+                config_path = Util.get_abs_path("config.json")
+
+            cls.data = Util.read_json(config_path)
+
+    @classmethod
+    def get_optional_param(cls, key, default_value: Any = None) -> Any:
+        """
+        Same as get_config_param, for keys that can be left out: a missing
+        key is not an error
+        """
+        try:
+            cls.load()
+        except Exception as e:
+            Util.error(e)
+            return default_value
+
+        return cls.data.get(key, default_value)
+
     @classmethod
     def get_child_param(cls, parent, child, default_value: Any = None):
         conf = cls.get_config_param(parent, {})
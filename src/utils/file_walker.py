@@ -0,0 +1,247 @@
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, NamedTuple, Optional, Pattern, Tuple
+
+from src.utils.util import Util
+
+
+class IgnoreRule(NamedTuple):
+    # Relative path of the folder the rule was written in, "" or ending with /
+    base: str
+    pattern: Pattern
+    is_negated: bool
+    is_dir_only: bool
+
+
+class IgnoreRules:
+    """
+    The subset of .gitignore syntax that matters for a search: comments,
+    "!" negation, trailing "/" for folders only, leading or inner "/" to
+    anchor a pattern to its folder, and the *, ?, [...] and ** wildcards.
+    The last rule that matches a path decides.
+    """
+
+    @staticmethod
+    def translate(glob: str) -> str:
+        ret = []
+        i = 0
+
+        while i < len(glob):
+            if glob.startswith("**/", i):
+                ret.append("(?:.*/)?")
+                i += 3
+            elif glob.startswith("**", i):
+                ret.append(".*")
+                i += 2
+            elif glob[i] == "*":
+                ret.append("[^/]*")
+                i += 1
+            elif glob[i] == "?":
+                ret.append("[^/]")
+                i += 1
+            elif glob[i] == "[" and glob.find("]", i + 2) != -1:
+                end = glob.find("]", i + 2)
+                chars = glob[i + 1 : end]
+
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+
+                ret.append("[" + chars.replace("\\", "\\\\") + "]")
+                i = end + 1
+            elif glob[i] == "\\" and i + 1 < len(glob):
+                ret.append(re.escape(glob[i + 1]))
+                i += 2
+            else:
+                ret.append(re.escape(glob[i]))
+                i += 1
+
+        return "".join(ret)
+
+    @classmethod
+    def parse(cls, lines: List[str], base: str = "") -> List[IgnoreRule]:
+        ret = []
+
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+
+            if len(line) == 0 or line.startswith("#"):
+                continue
+
+            is_negated = line.startswith("!")
+
+            if is_negated or line.startswith("\\"):
+                line = line[1:]
+
+            is_dir_only = line.endswith("/")
+            line = line.rstrip("/")
+
+            if len(line) == 0:
+                continue
+
+            # Without an inner slash a pattern matches a name at any depth
+            if "/" not in line:
+                line = "**/" + line
+
+            pattern = re.compile(cls.translate(line.lstrip("/")), re.DOTALL)
+            ret.append(IgnoreRule(base, pattern, is_negated, is_dir_only))
+
+        return ret
+
+    @staticmethod
+    def is_ignored(rules: Tuple[IgnoreRule, ...], rel_path: str, is_dir: bool) -> bool:
+        for rule in reversed(rules):
+            if rule.is_dir_only and not is_dir:
+                continue
+
+            if rule.pattern.fullmatch(rel_path, len(rule.base)):
+                return not rule.is_negated
+
+        return False
+
+
+class FileWalker:
+    """
+    Lists the files under a root with os.scandir, reusing what the directory
+    listing already knows about every entry, and with up to n_workers
+    folders listed at once. Hidden entries, python cache folders, files
+    without a wanted extension and anything matched by exclude rules or by
+    the .gitignore files on the way are skipped during the walk. Files come
+    out as soon as their folder was listed, in no particular order.
+    """
+
+    root: str = None
+    file_extensions: Optional[set] = None
+    n_workers: int = 8
+
+    # Rules that apply to the whole tree, besides .gitignore files
+    rules: Tuple[IgnoreRule, ...] = ()
+
+    def __init__(
+        self,
+        root: str,
+        file_extensions: Optional[List[str]] = None,
+        excludes: Optional[List[str]] = None,
+        n_workers: int = 8,
+    ):
+        self.root = root
+        self.file_extensions = None if file_extensions is None else set(file_extensions)
+        self.n_workers = n_workers
+        self.rules = tuple(IgnoreRules.parse(excludes or []))
+
+    def is_wanted(self, name: str) -> bool:
+        if self.file_extensions is None:
+            return True
+
+        return "." in name and name.rpartition(".")[2] in self.file_extensions
+
+    @staticmethod
+    def read_ignore_file(path: str, base: str) -> List[IgnoreRule]:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                return IgnoreRules.parse(file.readlines(), base)
+        except OSError as e:
+            Util.warn(e)
+            return []
+
+    def list_dir(
+        self, path: str, rel_dir: str, rules: Tuple[IgnoreRule, ...], with_stat: bool
+    ) -> Tuple[List[Tuple[str, Optional[Tuple[int, int, int]]]], List[Tuple]]:
+        """
+        (files, folders) of one folder: files as (path relative to the root,
+        (mtime_ns, size, inode) or None), folders as arguments of list_dir
+        """
+        files = []
+        dirs = []
+
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as e:
+            Util.warn(e)
+            return files, dirs
+
+        for entry in entries:
+            if entry.name == ".gitignore":
+                rules = rules + tuple(self.read_ignore_file(entry.path, rel_dir))
+                break
+
+        for entry in entries:
+            name = entry.name
+
+            # Hidden entries, and "__" ones such as Python caches
+            if name.startswith(".") or name.startswith("__"):
+                continue
+
+            try:
+                if entry.is_dir():
+                    if len(rules) > 0 and IgnoreRules.is_ignored(
+                        rules, rel_dir + name, True
+                    ):
+                        continue
+
+                    dirs.append((entry.path, rel_dir + name + "/", rules, with_stat))
+                elif entry.is_file() and self.is_wanted(name):
+                    if len(rules) > 0 and IgnoreRules.is_ignored(
+                        rules, rel_dir + name, False
+                    ):
+                        continue
+
+                    stat = None
+
+                    if with_stat:
+                        st = entry.stat()
+                        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+                    files.append((entry.path[len(self.root) :], stat))
+            except OSError as e:
+                # Vanished between listing and stat
+                Util.warn(e)
+
+        return files, dirs
+
+    def walk(
+        self, with_stat: bool = True
+    ) -> Iterator[Tuple[str, Optional[Tuple[int, int, int]]]]:
+        """
+        Yields (path relative to the root, (mtime_ns, size, inode) or None
+        when with_stat is False) of every wanted file. A root that is a file
+        yields itself as "".
+        """
+        if os.path.isfile(self.root):
+            st = os.stat(self.root)
+            yield "", (st.st_mtime_ns, st.st_size, st.st_ino) if with_stat else None
+            return
+
+        if not os.path.isdir(self.root):
+            return
+
+        first = (self.root, "", self.rules, with_stat)
+
+        if self.n_workers <= 1:
+            stack = [first]
+
+            while len(stack) > 0:
+                files, dirs = self.list_dir(*stack.pop())
+                stack += reversed(dirs)
+
+                yield from files
+
+            return
+
+        pool = ThreadPoolExecutor(self.n_workers, thread_name_prefix="walk")
+
+        try:
+            pending = {pool.submit(self.list_dir, *first)}
+
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    files, dirs = future.result()
+                    pending |= {pool.submit(self.list_dir, *args) for args in dirs}
+
+                    yield from files
+        finally:
+            # Also when the caller stops early
+            pool.shutdown(wait=False, cancel_futures=True)
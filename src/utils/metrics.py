@@ -0,0 +1,145 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class Metrics:
+    """
+    Process-wide stage latency histograms and counters, exported in the
+    Prometheus text format. A request can also collect the time it spent
+    in each stage, see collect(). Safe to use from executor threads.
+    """
+
+    prefix = "naive_doc_search"
+
+    # Upper bounds of the latency buckets, in seconds
+    buckets = (
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+
+    # stage -> [count per bucket..., count above the last one], sum, count
+    histograms: Dict[str, List] = {}
+    counters: Dict[str, float] = {}
+
+    # name -> (help, function returning the current value)
+    gauges: Dict[str, tuple] = {}
+
+    lock = threading.Lock()
+
+    # stage -> ms spent in it by the current request, None when not collecting
+    request_timings: contextvars.ContextVar = contextvars.ContextVar(
+        "request_timings", default=None
+    )
+
+    @classmethod
+    def observe(cls, stage: str, seconds: float):
+        with cls.lock:
+            histogram = cls.histograms.get(stage)
+
+            if histogram is None:
+                histogram = cls.histograms[stage] = [
+                    [0] * (len(cls.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+
+            histogram[0][bisect.bisect_left(cls.buckets, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+            timings = cls.request_timings.get()
+
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + seconds * 1000.0
+
+    @classmethod
+    @contextlib.contextmanager
+    def time(cls, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            cls.observe(stage, time.perf_counter() - start)
+
+    @classmethod
+    def inc(cls, name: str, amount: float = 1):
+        with cls.lock:
+            cls.counters[name] = cls.counters.get(name, 0) + amount
+
+    @classmethod
+    def register_gauge(cls, name: str, help_text: str, get_value: Callable[[], float]):
+        cls.gauges[name] = (help_text, get_value)
+
+    @classmethod
+    def collect(cls) -> Dict[str, float]:
+        """
+        Starts collecting the stage timings of the current request (and of
+        the tasks and executor jobs it starts) into the returned dict
+        """
+        ret = {}
+        cls.request_timings.set(ret)
+
+        return ret
+
+    @classmethod
+    def render(cls) -> str:
+        lines = []
+        name = f"{cls.prefix}_stage_duration_seconds"
+
+        with cls.lock:
+            lines += [
+                f"# HELP {name} Time spent in each stage of indexing and searching",
+                f"# TYPE {name} histogram",
+            ]
+
+            for stage, (counts, total, count) in sorted(cls.histograms.items()):
+                cumulative = 0
+
+                for bound, n in zip(cls.buckets, counts):
+                    cumulative += n
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                    )
+
+                lines += [
+                    f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}',
+                    f'{name}_sum{{stage="{stage}"}} {total}',
+                    f'{name}_count{{stage="{stage}"}} {count}',
+                ]
+
+            for counter, value in sorted(cls.counters.items()):
+                lines += [
+                    f"# TYPE {cls.prefix}_{counter} counter",
+                    f"{cls.prefix}_{counter} {value}",
+                ]
+
+        for gauge, (help_text, get_value) in sorted(cls.gauges.items()):
+            value: Optional[float] = get_value()
+
+            if value is None:
+                continue
+
+            lines += [
+                f"# HELP {cls.prefix}_{gauge} {help_text}",
+                f"# TYPE {cls.prefix}_{gauge} gauge",
+                f"{cls.prefix}_{gauge} {value}",
+            ]
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,105 @@
+import sys
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SizedLRUCache:
+    """
+    LRU cache bounded by an estimate of its values' size in bytes rather than
+    by entry count. Not thread-safe, meant to be used from the event loop.
+    """
+
+    max_bytes: int = 0
+    n_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    # key -> (value, size)
+    entries: OrderedDict = None
+    size_of: Callable[[Any], int] = None
+
+    def __init__(self, max_bytes: int, size_of: Optional[Callable[[Any], int]] = None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size_of = size_of or SizedLRUCache.estimate_size
+
+    @staticmethod
+    def estimate_size(obj: Any) -> int:
+        """
+        Deep size of JSON-like values (dicts, lists, tuples, strings, numbers)
+        """
+        ret = sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                ret += SizedLRUCache.estimate_size(k) + SizedLRUCache.estimate_size(v)
+        elif isinstance(obj, (list, tuple)):
+            for v in obj:
+                ret += SizedLRUCache.estimate_size(v)
+
+        return ret
+
+    def get(self, key: Hashable, default_value: Any = None) -> Any:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return default_value
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return entry[0]
+
+    def peek(self, key: Hashable, default_value: Any = None) -> Any:
+        """
+        Like get() but without touching recency or hit counters
+        """
+        entry = self.entries.get(key)
+
+        return default_value if entry is None else entry[0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None):
+        if size is None:
+            size = self.size_of(value)
+
+        self.pop(key)
+
+        # Would evict everything else and still not fit
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (value, size)
+        self.n_bytes += size
+
+        while self.n_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.n_bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return None
+
+        self.n_bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self.entries.clear()
+        self.n_bytes = 0
+
+    def stats(self) -> Dict:
+        n_lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self.entries),
+            "bytes": self.n_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / n_lookups if n_lookups > 0 else 0.0,
+            "evictions": self.evictions,
+        }
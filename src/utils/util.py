@@ -1,4 +1,5 @@
 import asyncio
+import contextvars
 import copy
 import datetime
 import functools
@@ -18,12 +19,9 @@ from enum import Enum
 from functools import total_ordering
 from typing import Optional, Any, Coroutine, Union, Dict, List
 
-import json5
-import multiexit
-import numpy
-import pandas
-import nest_asyncio
-from dotenv import load_dotenv
+# pandas, numpy, json5, nest_asyncio, multiexit and dotenv are imported by the
+# functions that need them, so that importing Util (which every entry point
+# does) stays cheap. See src/bench/import_time.py
 
 
 @total_ordering
@@ -52,6 +50,8 @@ class Util:
     @classmethod
     def init(cls):
         if not cls.is_initialized:
+            import nest_asyncio
+
             Util.get_env_param("")
             nest_asyncio.apply()
 
@@ -76,6 +76,8 @@ class Util:
 
     @staticmethod
     def get_percentile(sorted_data_arr: list, data_pt):
+        import numpy
+
         return (
             numpy.searchsorted(sorted_data_arr, data_pt) * 100.0 / len(sorted_data_arr)
         )
@@ -140,17 +142,23 @@ class Util:
     @staticmethod
     @functools.lru_cache
     def enable_multiexit():
+        import multiexit
+
         multiexit.install()
         return True
 
     @staticmethod
     @functools.lru_cache
     def read_csv(file_path: str, encoding="utf-8"):
+        import pandas
+
         return pandas.read_csv(file_path, encoding=encoding)
 
     @staticmethod
     @functools.lru_cache
     def read_excel(file_path: str, sheet_name=None, data_type=None):
+        import pandas
+
         return pandas.read_excel(file_path, sheet_name=sheet_name, dtype=data_type)
 
     @staticmethod
@@ -179,6 +187,8 @@ class Util:
             A dict without comments
         """
 
+        import json5
+
         content = open(file_path, "r", encoding=encoding).read()
 
         return json5.loads(content.strip())
@@ -343,6 +353,8 @@ class Util:
     @staticmethod
     def init_dotenv():
         if not Util.is_env_loaded:
+            from dotenv import load_dotenv
+
             load_dotenv()
             Util.is_env_loaded = True
 
@@ -543,7 +555,12 @@ class Util:
     @classmethod
     async def sync_to_async(cls, func):
         cls.init()
-        return await asyncio.get_running_loop().run_in_executor(None, func)
+
+        # Like asyncio.to_thread, func sees the caller's context variables
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(context.run, func)
+        )
 
     @staticmethod
     def ensure_valid_dict(params: dict[str, any], *required_args):
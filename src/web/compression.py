@@ -0,0 +1,97 @@
+from typing import Set
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        ret = self.compressor.process(body)
+
+        # Streamed frames must reach the client as they are produced
+        return ret + (
+            self.compressor.flush() if more_body else self.compressor.finish()
+        )
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least minimum_size bytes with the best
+    encoding the client accepts: br when the brotli package is installed,
+    then gzip. Server-sent events are never compressed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    @staticmethod
+    def get_quality(params: str) -> float:
+        """
+        q value of an Accept-Encoding entry, a malformed one counts as q=0
+        """
+        if not params.startswith("q="):
+            return 1.0
+
+        try:
+            return float(params[2:])
+        except ValueError:
+            return 0.0
+
+    @classmethod
+    def get_accepted_encodings(cls, accept_encoding: str) -> Set[str]:
+        ret = set()
+
+        for part in accept_encoding.split(","):
+            name, _, params = part.partition(";")
+            params = params.replace(" ", "")
+
+            # "gzip;q=0" means anything but gzip
+            if cls.get_quality(params) == 0:
+                continue
+
+            ret.add(name.strip().lower())
+
+        return ret
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = self.get_accepted_encodings(
+            Headers(scope=scope).get("Accept-Encoding", "")
+        )
+
+        if brotli is not None and "br" in encodings:
+            responder = BrotliResponder(
+                self.app, self.minimum_size, quality=self.brotli_quality
+            )
+        elif "gzip" in encodings:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.gzip_level
+            )
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+
+        await responder(scope, receive, send)
@@ -1,20 +1,50 @@
+import asyncio
+import base64
+import json
+from typing import Any, AsyncIterator, Coroutine, Dict
+
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import Response, StreamingResponse
 
+from src.utils.metrics import Metrics
 from src.utils.util import Util
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class WebUtil:
 
+    @staticmethod
+    def dumps(content: Any) -> bytes:
+        """
+        Compact UTF-8 JSON, with orjson when it is installed
+        """
+        with Metrics.time("encode"):
+            if orjson is not None:
+                return orjson.dumps(
+                    content,
+                    option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+                )
+
+            return json.dumps(
+                content, ensure_ascii=False, separators=(",", ":")
+            ).encode()
+
     @staticmethod
     def make_response(content: any, is_good: bool = True, status_code: int = 200):
-        return JSONResponse(
-            {
-                "status": 0 if is_good else 1,
-                "timestamp": Util.time_now().isoformat(),
-                "content": content,
-            },
+        return Response(
+            WebUtil.dumps(
+                {
+                    "status": 0 if is_good else 1,
+                    "timestamp": Util.time_now().isoformat(),
+                    "content": content,
+                }
+            ),
             status_code=status_code,
+            media_type="application/json",
         )
 
     @staticmethod
@@ -29,6 +59,55 @@ class WebUtil:
             Util.get_proper_msg(error), is_good=False, status_code=status_code
         )
 
+    @staticmethod
+    def make_stream(frames: AsyncIterator[Dict], is_sse: bool = False):
+        """
+        Streams every frame as one NDJSON line, or as one SSE data event
+        """
+
+        async def encode():
+            async for frame in frames:
+                payload = WebUtil.dumps(frame)
+
+                yield b"data: " + payload + b"\n\n" if is_sse else payload + b"\n"
+
+        return StreamingResponse(
+            encode(),
+            media_type="text/event-stream" if is_sse else "application/x-ndjson",
+        )
+
+    @staticmethod
+    async def run_until_disconnected(
+        request: Request, coroutine: Coroutine, poll_interval: float = 0.1
+    ) -> Any:
+        """
+        Awaits coroutine, cancelling it if the client goes away in the meantime
+        """
+        task = asyncio.ensure_future(coroutine)
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=poll_interval)
+
+                if len(done) > 0:
+                    return task.result()
+
+                if await request.is_disconnected():
+                    raise Exception("client disconnected, search cancelled")
+        finally:
+            task.cancel()
+
+    @staticmethod
+    def encode_cursor(state: Dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Dict:
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except Exception:
+            raise Exception(f"bad cursor: {cursor}")
+
     @staticmethod
     async def get_params(request: Request):
         is_post = request.method == "POST"